@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import contextlib
+import contextvars
+import json
+import math
+import time
+
+import metrics
+
+# Endpoints that do real work and so wait for an admission slot, with
+# everything below them
+ADMITTED_PATHS = ("/humanize", "/humanize/batch", "/humanize/stream", "/detect-style", "/sessions")
+# Endpoints only bounded by a deadline the client asks for; a large upload
+# can legitimately take longer than any default
+UNTIMED_PATHS = ("/humanize/stream",)
+# Request header carrying the client's deadline, in milliseconds
+TIMEOUT_HEADER = b"x-humanize-timeout-ms"
+
+
+class DeadlineExceeded(Exception):
+    """The deadline of the request passed before its work was done."""
+
+
+_deadline = contextvars.ContextVar("humanize_deadline", default=None)
+
+
+def remaining():
+    """Seconds left until the current deadline, or None without one."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded by {-left * 1000:.0f}ms")
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Run the enclosed block with a deadline seconds from now (None for none)."""
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class AdmissionControl:
+    """
+    ASGI middleware that bounds concurrent and queued requests and gives
+    each admitted one a deadline.
+    """
+    def __init__(self, app, max_concurrency=8, max_queue=32, timeout=10.0, max_timeout=60.0,
+                 paths=ADMITTED_PATHS, untimed_paths=UNTIMED_PATHS):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.paths = set(paths)
+        self.untimed_paths = set(untimed_paths)
+        self._in_flight = 0
+        self._waiters = collections.deque()
+        # Moving average of the time an admitted request holds its slot
+        self._service_seconds = 0.1
+
+    def _admitted_path(self, path):
+        """The configured path a request falls under, or None."""
+        if path in self.paths:
+            return path
+        while "/" in path.rstrip("/"):
+            path = path.rstrip("/").rsplit("/", 1)[0]
+            if path in self.paths:
+                return path
+        return None
+
+    def _timeout(self, scope, path):
+        for name, value in scope.get("headers", ()):
+            if name == TIMEOUT_HEADER:
+                try:
+                    requested = float(value) / 1000
+                except ValueError:
+                    break
+                if requested > 0:
+                    return min(requested, self.max_timeout)
+                break
+        if path in self.untimed_paths:
+            return None
+        return self.timeout
+
+    def retry_after(self):
+        """Seconds until the queue ahead of a new request should have drained."""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(backlog * self._service_seconds / self.max_concurrency))
+
+    def _update_gauges(self):
+        metrics.REQUESTS_IN_FLIGHT.set(self._in_flight)
+        metrics.REQUESTS_QUEUED.set(len(self._waiters))
+
+    async def _acquire(self, timeout):
+        """Take a slot; False if the timeout passed while queued."""
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            self._update_gauges()
+            return True
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except BaseException:
+            # Cancelled just as a slot was handed over: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+
+    def _release(self):
+        # Hand the slot straight to the next waiter that is still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._update_gauges()
+                return
+        self._in_flight -= 1
+        self._update_gauges()
+
+    async def _refuse(self, send, status, detail, retry_after):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(retry_after).encode("latin-1"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        path = self._admitted_path(scope["path"]) if scope["type"] == "http" else None
+        if path is None:
+            await self.app(scope, receive, send)
+            return
+
+        timeout = self._timeout(scope, path)
+        if self._in_flight >= self.max_concurrency and len(self._waiters) >= self.max_queue:
+            metrics.REQUESTS_SHED.inc(path=path, reason="queue_full")
+            await self._refuse(send, 429, "Too many requests in progress", self.retry_after())
+            return
+
+        with deadline(timeout):
+            if not await self._acquire(timeout):
+                metrics.REQUESTS_SHED.inc(path=path, reason="queue_timeout")
+                await self._refuse(send, 503, "Deadline exceeded while queued", self.retry_after())
+                return
+            started = time.perf_counter()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._service_seconds += 0.2 * (elapsed - self._service_seconds)
+                self._release()
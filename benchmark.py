@@ -0,0 +1,360 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from dictionary_db import InMemoryDictionaryDB, seed_patterns, seed_words
+from test_indobert import detect_context, translate_text
+
+# Input sizes in characters; "sentence" is a single generated sentence
+INPUT_SIZES = {"sentence": 0, "1kb": 1024, "10kb": 10 * 1024, "100kb": 100 * 1024}
+DICTIONARY_SIZES = (100, 1000, 10000, 100000)
+TARGETS = ("translate_text", "detect_context", "app")
+# Options of --quick runs, where not given explicitly
+QUICK_DEFAULTS = {"dictionary_sizes": "100,1000", "inputs": "sentence,1kb", "min_time": 0.2}
+# Opt-in: starts worker processes, see --workers
+EXTRA_TARGETS = ("parallel",)
+
+SYLLABLES = ["ba", "ka", "la", "ma", "na", "pa", "ra", "sa", "ta", "ng", "ri", "ku", "se", "lo", "du", "ji", "wa", "ha"]
+PREFIXES = ["me", "mem", "ber", "di", "ter", "pe", ""]
+SUFFIXES = ["kan", "an", "i", "nya", ""]
+SYNTHETIC_CATEGORIES = ["verbs", "nouns", "adjectives", "adverbs"]
+FILLER = ["saya", "dapat", "anda", "untuk", "dan", "yang", "di", "atau", "melalui", "tahun", "langkah", "baru"]
+
+
+def synthetic_lexicon(size, seed=0):
+    """
+    Seed words plus generated entries, size entries in total.
+
+    About one in twenty generated entries is a two-word phrase, so the
+    phrase automaton grows with the dictionary like a real one would.
+    """
+    rng = random.Random(seed)
+    entries = list(seed_words())
+    seen = {entry["word"].lower() for entry in entries}
+    while len(entries) < size:
+        word = rng.choice(PREFIXES) + "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) + rng.choice(SUFFIXES)
+        category = rng.choice(SYNTHETIC_CATEGORIES)
+        if rng.random() < 0.05:
+            word = f"{word} {rng.choice(SYLLABLES)}{rng.choice(SYLLABLES)}"
+            category = "phrases"
+        if word in seen:
+            continue
+        seen.add(word)
+        casual = word[:-3] + "in" if word.endswith("kan") else word
+        entries.append({
+            "word": word,
+            "translations": {"casual": [casual], "personal": [word]},
+            "category": category
+        })
+    return entries
+
+
+def synthetic_text(entries, size, seed=0):
+    """
+    Sentences mixing dictionary words with common filler, at least size
+    characters long (a single sentence for size 0).
+    """
+    rng = random.Random(seed)
+    words = [entry["word"] for entry in entries]
+    sentences = []
+    length = 0
+    while not sentences or length < size:
+        sentence = [rng.choice(words) if rng.random() < 0.5 else rng.choice(FILLER) for _ in range(rng.randint(8, 16))]
+        if rng.random() < 0.3:
+            sentence.insert(rng.randint(1, len(sentence) - 1), ",")
+        text = " ".join(sentence).replace(" ,", ",")
+        sentences.append(text[0].upper() + text[1:] + rng.choice([".", ".", ".", "?", "!"]))
+        length += len(sentences[-1]) + 1
+    return " ".join(sentences)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def measure(func, min_iterations=5, min_seconds=1.0, max_iterations=100000):
+    """
+    Call func until both min_iterations and min_seconds are reached.
+
+    The first call is a warm-up and is not recorded. Returns the latency
+    of every recorded call, in seconds.
+    """
+    func()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_iterations and (
+        len(latencies) < min_iterations or time.perf_counter() - started < min_seconds
+    ):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return latencies
+
+
+def summarize(latencies, characters):
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "ops_per_sec": round(len(ordered) / total, 2),
+        "chars_per_sec": round(characters * len(ordered) / total)
+    }
+
+
+async def asgi_request(app, method, path, body=b"", headers=(), query_string=b""):
+    """
+    Send one HTTP request straight to an ASGI app, without a server.
+
+    Returns (status, headers, body).
+    """
+    request_sent = False
+    response_complete = asyncio.Event()
+    response = {"status": None, "headers": [], "body": bytearray()}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like a real server: the client only goes away after the response
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [(b"host", b"localhost"), (b"content-length", str(len(body)).encode())] + list(headers),
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80)
+    }
+    await app(scope, receive, send)
+    return response["status"], response["headers"], bytes(response["body"])
+
+
+def benchmark_app(db, text, min_iterations, min_seconds):
+    """Measure POST /humanize in-process, with the result cache cleared before every call."""
+    import humanizeindo
+    humanizeindo.app.state.db = db
+    body = json.dumps({"text": text}).encode("utf-8")
+    headers = [(b"content-type", b"application/json")]
+    loop = asyncio.new_event_loop()
+
+    def call():
+        humanizeindo.result_cache.clear()
+        status, _, content = loop.run_until_complete(asgi_request(humanizeindo.app, "POST", "/humanize", body, headers))
+        if status != 200:
+            raise RuntimeError(f"/humanize returned {status}: {content[:200]!r}")
+
+    try:
+        return measure(call, min_iterations, min_seconds)
+    finally:
+        loop.close()
+
+
+def run(dictionary_sizes, input_sizes, targets, min_iterations=5, min_seconds=1.0, seed=0, progress=None,
+        workers=None):
+    """Run every (dictionary size, input size, target) combination and return the results."""
+    results = []
+    for dictionary_size in dictionary_sizes:
+        entries = synthetic_lexicon(dictionary_size, seed)
+        started = time.perf_counter()
+        db = InMemoryDictionaryDB(entries, list(seed_patterns()))
+        with contextlib.redirect_stdout(sys.stderr):
+            db.connect()
+        db.get_matcher()
+        db.get_classifier()
+        build_seconds = time.perf_counter() - started
+        results.append({
+            "target": "build",
+            "dictionary_size": len(entries),
+            "seconds": round(build_seconds, 4)
+        })
+        if progress:
+            progress(results[-1])
+
+        humanizer = None
+        if "parallel" in targets:
+            from parallel import ParallelHumanizer
+            humanizer = ParallelHumanizer(db, workers=workers, min_chars=0)
+            humanizer.start()
+
+        for input_name in input_sizes:
+            text = synthetic_text(entries, INPUT_SIZES[input_name], seed)
+            for target in targets:
+                if target == "translate_text":
+                    latencies = measure(lambda: translate_text(text, db), min_iterations, min_seconds)
+                elif target == "detect_context":
+                    latencies = measure(lambda: detect_context(text, db), min_iterations, min_seconds)
+                elif target == "parallel":
+                    latencies = measure(lambda: humanizer.humanize(text), min_iterations, min_seconds)
+                else:
+                    latencies = benchmark_app(db, text, min_iterations, min_seconds)
+                result = {
+                    "target": target,
+                    "dictionary_size": len(entries),
+                    "input": input_name,
+                    "characters": len(text)
+                }
+                if target == "parallel":
+                    result["workers"] = humanizer.workers
+                result.update(summarize(latencies, len(text)))
+                results.append(result)
+                if progress:
+                    progress(result)
+        if humanizer is not None:
+            humanizer.close()
+        db.close()
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def result_key(result):
+    return (result["target"], result["dictionary_size"], result.get("input"))
+
+
+def compare(baseline, results, threshold):
+    """
+    Print p50/p99 changes against a baseline run; return the regressions
+    """
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get(result_key(result))
+        if old is None or "p50_ms" not in result:
+            continue
+        p50 = result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        p99 = result["p99_ms"] / old["p99_ms"] - 1 if old["p99_ms"] else 0.0
+        flag = "REGRESSION" if p50 > threshold else ""
+        if flag:
+            regressions.append(result)
+        print(
+            f"{result['target']:>15} {result['dictionary_size']:>7} {result['input']:>8}  "
+            f"p50 {old['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms ({p50:+.1%})  "
+            f"p99 {old['p99_ms']:.3f} -> {result['p99_ms']:.3f} ms ({p99:+.1%})  {flag}",
+            file=sys.stderr
+        )
+    return regressions
+
+
+def print_result(result):
+    if result["target"] == "build":
+        print(f"dictionary of {result['dictionary_size']} entries built in {result['seconds']:.3f}s", file=sys.stderr)
+        return
+    print(
+        f"{result['target']:>15} {result['dictionary_size']:>7} {result['input']:>8}  "
+        f"p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+        f"{result['ops_per_sec']:10.1f} ops/s  {result['chars_per_sec'] / 1e6:7.2f} MB/s",
+        file=sys.stderr
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark translate_text, detect_context and POST /humanize on an in-memory "
+                    "dictionary of seed plus synthetic words, without MongoDB",
+        epilog="example: benchmark.py --output before.json; benchmark.py --compare before.json"
+    )
+    parser.add_argument("--dictionary-sizes",
+                        help=f"comma-separated dictionary sizes (entries, default {','.join(map(str, DICTIONARY_SIZES))})")
+    parser.add_argument("--inputs", help=f"comma-separated input sizes from {list(INPUT_SIZES)} (default all)")
+    parser.add_argument("--targets", default=",".join(TARGETS),
+                        help=f"comma-separated targets from {list(TARGETS + EXTRA_TARGETS)}")
+    parser.add_argument("--workers", type=int, help="worker processes of the parallel target (default: CPU count)")
+    parser.add_argument("--min-iterations", type=int, default=5, help="recorded calls per scenario, at least")
+    parser.add_argument("--min-time", type=float, help="seconds per scenario, at least (default 1)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic dictionary and texts")
+    parser.add_argument("--quick", action="store_true",
+                        help="small dictionaries and inputs, short runs, unless given explicitly")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON ('-' for stdout)")
+    parser.add_argument("--compare", metavar="FILE", help="compare against the JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="p50 slowdown counted as a regression by --compare (default 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    # --quick only fills in the options that were not given
+    defaults = QUICK_DEFAULTS if args.quick else {
+        "dictionary_sizes": ",".join(map(str, DICTIONARY_SIZES)), "inputs": ",".join(INPUT_SIZES), "min_time": 1.0
+    }
+    for name, value in defaults.items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+
+    dictionary_sizes = [int(size) for size in args.dictionary_sizes.split(",")]
+    inputs = args.inputs.split(",")
+    targets = args.targets.split(",")
+    for name in inputs:
+        if name not in INPUT_SIZES:
+            parser.error(f"unknown input size {name!r}")
+    for name in targets:
+        if name not in TARGETS + EXTRA_TARGETS:
+            parser.error(f"unknown target {name!r}")
+
+    results = run(dictionary_sizes, inputs, targets, args.min_iterations, args.min_time, args.seed, print_result,
+                  args.workers)
+    report = {"environment": environment(), "results": results}
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            regressions = compare(json.load(handle), results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with an optional per-entry TTL.
+
+    Keeps hit, miss and eviction counters so callers can expose them.
+    Entries that outlive ttl seconds count as misses and are dropped.
+    With weigh and maxweight, the total weigh(value) of the entries (e.g.
+    estimated bytes) is bounded too; a value heavier than that is not cached.
+    """
+    def __init__(self, maxsize=1024, ttl=None, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key -> (expires_at, value, weight)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] is not None and item[0] <= time.monotonic():
+                del self._data[key]
+                self.weight -= item[2]
+                item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        weight = self.weigh(value) if self.weigh else 0
+        with self._lock:
+            previous = self._data.pop(key, _MISSING)
+            if previous is not _MISSING:
+                self.weight -= previous[2]
+            if self.maxweight is not None and weight > self.maxweight:
+                return
+            self._data[key] = (expires_at, value, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.maxweight is not None and self.weight > self.maxweight):
+                _, item = self._data.popitem(last=False)
+                self.weight -= item[2]
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            if item is not _MISSING:
+                self.weight -= item[2]
+        return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self):
+        """Current size and counters, e.g. for a stats endpoint."""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "weight": self.weight,
+            "maxweight": self.maxweight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,326 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+from caching import LRUCache
+from dictionary_db import MATCHER_CATEGORIES, DictionaryDB, DictionaryEntry, build_matcher, normalize_word
+from style_classifier import CLASSIFIER_CATEGORIES, StyleClassifier
+import metrics
+
+# File layout: header, sorted index of fixed-size records, string pool, meta.
+# Each record points at a normalized key and its JSON-encoded entry in the
+# pool; meta holds the (small) category lists, patterns and version stamp.
+MAGIC = b"HIDX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIIQQQQ")  # magic, format, words, index, pool, meta offset, meta length
+RECORD = struct.Struct("<QIQI")  # key offset, key length, entry offset, entry length
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _hashable(value):
+    """JSON turns tuples into lists; turn them back so versions can be keys."""
+    return tuple(_hashable(item) for item in value) if isinstance(value, list) else value
+
+
+def _public(document, *hidden):
+    return {field: value for field, value in document.items() if field not in ("_id",) + hidden}
+
+
+def write_artifact(path, entries, patterns, version):
+    """
+    Compile entries and patterns into an artifact file.
+
+    The file is written next to path and renamed into place, so running
+    services see either the old or the new artifact, never a partial one.
+    """
+    # Sort by the UTF-8 bytes of the normalized key; the first spelling wins
+    words = {}
+    for entry in entries:
+        words.setdefault(normalize_word(entry["word"]).encode("utf-8"), _public(entry, "key"))
+    keys = sorted(words)
+
+    pool = bytearray()
+    records = []
+    categories = {}
+    for index, key in enumerate(keys):
+        entry = words[key]
+        blob = _encode(entry)
+        records.append(RECORD.pack(len(pool), len(key), len(pool) + len(key), len(blob)))
+        pool += key
+        pool += blob
+        categories.setdefault(entry.get("category"), []).append(index)
+
+    meta = _encode({
+        "version": version,
+        "built_at": time.time(),
+        "categories": categories,
+        "patterns": [_public(pattern) for pattern in patterns]
+    })
+    index_offset = HEADER.size
+    pool_offset = index_offset + RECORD.size * len(records)
+    meta_offset = pool_offset + len(pool)
+
+    temporary = f"{path}.tmp{os.getpid()}"
+    with open(temporary, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(records), index_offset, pool_offset, meta_offset, len(meta)))
+        handle.writelines(records)
+        handle.write(pool)
+        handle.write(meta)
+    os.replace(temporary, path)
+    return {"words": len(records), "patterns": len(patterns), "bytes": meta_offset + len(meta)}
+
+
+def build_artifact(db, path):
+    """
+    Compile the dictionary and patterns collections of a DictionaryDB
+    """
+    if db.dictionary is None and not db.connect():
+        raise ConnectionError("Could not connect to MongoDB")
+    version = db._read_version()
+    return write_artifact(path, db.dictionary.find({}), list(db.patterns.find({})), version)
+
+
+class ArtifactSnapshot:
+    """
+    Read-only view of a memory-mapped artifact.
+
+    Offers the same lookups as DictionarySnapshot. Index and string pool
+    stay in the page cache and are shared by every process mapping the
+    file; only looked-up entries are decoded, into a small per-process LRU.
+    """
+    def __init__(self, path, cache_size=65536):
+        self.path = path
+        with open(path, "rb") as handle:
+            stat = os.fstat(handle.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, file_format, count, index_offset, pool_offset, meta_offset, meta_length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or file_format != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a dictionary artifact (format {FORMAT_VERSION})")
+        self.word_count = count
+        self._index_offset = index_offset
+        self._pool_offset = pool_offset
+        meta = json.loads(self._mm[meta_offset:meta_offset + meta_length].decode("utf-8"))
+        self.version = ("artifact", _hashable(meta["version"]), meta["built_at"])
+        self._category_indexes = meta["categories"]
+        self.patterns = meta["patterns"]
+        self._entries = LRUCache(maxsize=cache_size)
+        self._matcher = None
+        self._classifier = None
+
+    def close(self):
+        self._mm.close()
+
+    def _record(self, index):
+        return RECORD.unpack_from(self._mm, self._index_offset + index * RECORD.size)
+
+    def _key(self, index):
+        key_offset, key_length, _, _ = self._record(index)
+        start = self._pool_offset + key_offset
+        return self._mm[start:start + key_length]
+
+    def _entry(self, index):
+        entry = self._entries.get(index)
+        if entry is None:
+            _, _, entry_offset, entry_length = self._record(index)
+            start = self._pool_offset + entry_offset
+            entry = DictionaryEntry.from_document(json.loads(self._mm[start:start + entry_length].decode("utf-8")))
+            self._entries.put(index, entry)
+        return entry
+
+    def _find(self, key):
+        """Binary search the sorted index for a normalized key."""
+        low, high = 0, self.word_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._key(middle)
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def get_entry(self, word):
+        index = self._find(normalize_word(word).encode("utf-8"))
+        return self._entry(index) if index >= 0 else None
+
+    def get_translations(self, word):
+        entry = self.get_entry(word)
+        return entry.translations if entry else None
+
+    def get_entries(self, words):
+        entries = {}
+        for word in words:
+            entry = self.get_entry(word)
+            if entry:
+                entries[normalize_word(word)] = entry
+        return entries
+
+    def get_by_category(self, category):
+        return [self._entry(index) for index in self._category_indexes.get(category, [])]
+
+    def get_pattern(self, pattern_type=None, formal_pattern=None):
+        return [
+            pattern for pattern in self.patterns
+            if (not pattern_type or pattern["pattern_type"] == pattern_type)
+            and (not formal_pattern or pattern["formal_pattern"] == formal_pattern)
+        ]
+
+    @property
+    def matcher(self):
+        """Phrase matcher compiled once per artifact on first use."""
+        if self._matcher is None:
+            categories = {category: self.get_by_category(category) for category in MATCHER_CATEGORIES}
+            self._matcher = build_matcher(categories, self.patterns)
+        return self._matcher
+
+    @property
+    def classifier(self):
+        """Style classifier built once per artifact on first use."""
+        if self._classifier is None:
+            categories = {category: self.get_by_category(category) for category in CLASSIFIER_CATEGORIES}
+            self._classifier = StyleClassifier.from_categories(categories)
+        return self._classifier
+
+
+class ArtifactDictionaryDB(DictionaryDB):
+    """
+    Read-only DictionaryDB backed by a precompiled artifact instead of Mongo.
+
+    Startup only maps the file. Replacing the file (e.g. with
+    dictionary_artifact.py build) is picked up within refresh_interval.
+    All write methods refuse and return False.
+    """
+    def __init__(self, path, refresh_interval=30.0, **kwargs):
+        super().__init__(refresh_interval=refresh_interval, **kwargs)
+        self.artifact_path = path
+
+    def connect(self):
+        try:
+            self.load_snapshot()
+            print(f"Loaded dictionary artifact {self.artifact_path} ({self._snapshot.word_count} words)")
+            return True
+        except (OSError, ValueError) as e:
+            print(f"Could not load dictionary artifact: {e}")
+            return False
+
+    def ensure_indexes(self):
+        return True
+
+    def close(self):
+        super().close()
+        if self._snapshot is not None:
+            self._snapshot.close()
+
+    @metrics.db_call
+    def load_snapshot(self):
+        snapshot = ArtifactSnapshot(self.artifact_path)
+        self._snapshot = snapshot
+        self._last_checked = time.monotonic()
+        return snapshot
+
+    def _snapshot_current(self, snapshot):
+        # A replaced file is loaded anew; the old mapping stays valid for
+        # readers still holding it
+        stat = os.stat(self.artifact_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size) == snapshot.identity
+
+    @property
+    def version(self):
+        return self.get_snapshot().version
+
+    @metrics.db_call
+    def get_matcher(self):
+        return self.get_snapshot().matcher
+
+    @metrics.db_call
+    def get_classifier(self):
+        return self.get_snapshot().classifier
+
+    @metrics.db_call
+    def get_entries(self, words):
+        return self.get_snapshot().get_entries(words)
+
+    @metrics.db_call
+    def get_translations(self, word):
+        return self.get_snapshot().get_translations(word)
+
+    @metrics.db_call
+    def get_by_category(self, category):
+        return self.get_snapshot().get_by_category(category)
+
+    @metrics.db_call
+    def get_pattern(self, pattern_type=None, formal_pattern=None):
+        return self.get_snapshot().get_pattern(pattern_type, formal_pattern)
+
+    def _read_only(self, action):
+        print(f"Cannot {action}: dictionary artifact {self.artifact_path} is read-only")
+        return False
+
+    def add_word(self, word, casual_translations, personal_translations, category):
+        return self._read_only(f"add word '{word}'")
+
+    def update_word(self, word, casual_translations=None, personal_translations=None, category=None):
+        return self._read_only(f"update word '{word}'")
+
+    def delete_word(self, word):
+        return self._read_only(f"delete word '{word}'")
+
+    def add_pattern(self, pattern_type, formal_pattern, casual_pattern, examples=None):
+        return self._read_only(f"add pattern '{pattern_type}:{formal_pattern}'")
+
+    def import_words(self, entries, batch_size=None, progress=None):
+        return self._read_only("import words")
+
+    def import_patterns(self, patterns, batch_size=None, progress=None):
+        return self._read_only("import patterns")
+
+
+def open_dictionary(artifact_path=None):
+    """
+    Create the dictionary backend: an artifact if a path is given (or set in
+    DICTIONARY_ARTIFACT), otherwise MongoDB
+    """
+    artifact_path = artifact_path or os.environ.get("DICTIONARY_ARTIFACT")
+    if artifact_path:
+        return ArtifactDictionaryDB(artifact_path)
+    return DictionaryDB()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile or inspect a memory-mapped dictionary artifact")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("path", help="artifact file to write or read")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.monotonic()
+        stats = build_artifact(DictionaryDB(), args.path)
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        print(json.dumps(stats))
+        return 0
+
+    snapshot = ArtifactSnapshot(args.path)
+    print(json.dumps({
+        "words": snapshot.word_count,
+        "patterns": len(snapshot.patterns),
+        "categories": {category: len(indexes) for category, indexes in snapshot._category_indexes.items()},
+        "version": snapshot.version,
+        "bytes": os.path.getsize(args.path)
+    }))
+    snapshot.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import sys
+import time
+
+from dictionary_db import IMPORT_BATCH_SIZE, DictionaryDB
+
+WORD_FIELDS = ["word", "category", "casual", "personal"]
+PATTERN_FIELDS = ["pattern_type", "formal_pattern", "casual_pattern", "examples"]
+LIST_FIELDS = {"casual", "personal", "examples"}
+LIST_SEPARATOR = "|"
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "jsonl"
+
+
+def open_file(path, mode):
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def read_rows(handle, file_format, errors):
+    """
+    Yield one dict per valid row; malformed rows are counted in errors
+    """
+    if file_format == "csv":
+        for row in csv.DictReader(handle):
+            yield {
+                field: [item for item in value.split(LIST_SEPARATOR) if item] if field in LIST_FIELDS else value
+                for field, value in row.items() if value is not None
+            }
+        return
+    for line_number, line in enumerate(handle, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            errors.append(f"line {line_number}: {e}")
+
+
+def is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def validate(rows, required, errors):
+    """
+    Drop rows that are not objects, miss required fields or hold fields
+    of the wrong type, counting them as errors
+    """
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append(f"row {number}: expected an object, got {type(row).__name__}")
+            continue
+        missing = [field for field in required if not row.get(field)]
+        if missing:
+            errors.append(f"row {number}: missing {', '.join(missing)}")
+            continue
+        invalid = [field for field in required if not isinstance(row[field], str)]
+        invalid += [field for field in LIST_FIELDS if field in row and not is_string_list(row[field])]
+        translations = row.get("translations")
+        if translations is not None and not (
+            isinstance(translations, dict) and all(is_string_list(value) for value in translations.values())
+        ):
+            invalid.append("translations")
+        if invalid:
+            errors.append(f"row {number}: invalid {', '.join(invalid)}")
+            continue
+        yield row
+
+
+def flatten_word(entry):
+    translations = entry.get("translations", {})
+    return {
+        "word": entry["word"],
+        "category": entry.get("category"),
+        "casual": translations.get("casual", []),
+        "personal": translations.get("personal", [])
+    }
+
+
+def write_rows(handle, file_format, fields, rows):
+    count = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(handle, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({
+                field: LIST_SEPARATOR.join(row.get(field) or []) if field in LIST_FIELDS else row.get(field)
+                for field in fields
+            })
+            count += 1
+        return count
+    for row in rows:
+        handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def import_file(db, path, patterns=False, file_format=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stream a JSONL/CSV file into the dictionary or patterns collection
+    """
+    file_format = file_format or detect_format(path)
+    errors = []
+    started = time.monotonic()
+
+    def progress(stats):
+        elapsed = time.monotonic() - started
+        print(
+            f"\r{stats['processed']} rows, {stats['upserted']} new, {stats['modified']} updated, "
+            f"{stats['errors'] + len(errors)} errors ({stats['processed'] / max(elapsed, 1e-9):.0f} rows/s)",
+            end="", file=sys.stderr, flush=True
+        )
+
+    handle = open_file(path, "r")
+    try:
+        if patterns:
+            rows = validate(read_rows(handle, file_format, errors), ["pattern_type", "formal_pattern", "casual_pattern"], errors)
+            stats = db.import_patterns(rows, batch_size=batch_size, progress=progress)
+        else:
+            rows = validate(read_rows(handle, file_format, errors), ["word", "category"], errors)
+            stats = db.import_words(rows, batch_size=batch_size, progress=progress)
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+    print(file=sys.stderr)
+    stats["errors"] += len(errors)
+    stats["seconds"] = round(time.monotonic() - started, 3)
+    return stats, errors
+
+
+def export_file(db, path, patterns=False, file_format=None):
+    """
+    Stream the dictionary or patterns collection into a JSONL/CSV file
+    """
+    file_format = file_format or detect_format(path)
+    handle = open_file(path, "w")
+    try:
+        if patterns:
+            return write_rows(handle, file_format, PATTERN_FIELDS, db.iter_patterns())
+        return write_rows(handle, file_format, WORD_FIELDS, (flatten_word(entry) for entry in db.iter_words()))
+    finally:
+        if handle is not sys.stdout:
+            handle.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Bulk import/export for the HumanizeIndo dictionary. Files are streamed row by row; "
+                    "word rows carry word, category, casual and personal, pattern rows carry pattern_type, "
+                    "formal_pattern, casual_pattern and examples. CSV list fields are separated by '|'.",
+        epilog="examples: dictionary_io.py import words.jsonl | "
+               "dictionary_io.py import patterns.csv --patterns | "
+               "dictionary_io.py export words.jsonl.gz"
+    )
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="JSONL or CSV file, optionally .gz; '-' for stdin/stdout")
+    parser.add_argument("--patterns", action="store_true", help="use the patterns collection instead of words")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="override the format detected from the extension")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="upserts per bulk write")
+    parser.add_argument("--show-errors", type=int, default=10, metavar="N", help="print the first N row errors")
+    args = parser.parse_args(argv)
+
+    db = DictionaryDB()
+    # stdout may carry exported rows, so status messages go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        connected = db.connect()
+    if not connected:
+        return 1
+
+    if args.command == "import":
+        stats, errors = import_file(db, args.path, args.patterns, args.format, args.batch_size)
+        for error in errors[:args.show_errors]:
+            print(f"  {error}", file=sys.stderr)
+        print(json.dumps(stats), file=sys.stderr)
+        return 1 if stats["errors"] else 0
+
+    count = export_file(db, args.path, args.patterns, args.format)
+    print(f"Exported {count} rows", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,120 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from pymongo.errors import PyMongoError
+from typing import Literal, Optional, List
+from admission import AdmissionControl, DeadlineExceeded, remaining
 from dictionary_db import DictionaryDB
-from test_indobert import translate_text, detect_context
+from dictionary_artifact import open_dictionary
+from caching import LRUCache
+from traffic import TrafficRecorder
+from parallel import PARALLEL_MIN_CHARS as DEFAULT_PARALLEL_MIN_CHARS, ParallelHumanizer
+from sessions import EditSession, RevisionConflict
+import metrics
+from test_indobert import translate_text, detect_context, classify_style, analyze_text, humanize_stream, TextAnalysis, RERANK_ENABLED, warm_model
+import asyncio
+import codecs
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Streamed request bodies larger than this are spooled to disk
+STREAM_SPOOL_BYTES = 1024 * 1024
+STREAM_READ_BYTES = 65536
+
+# Estimated bytes per word change record of a cached response
+CHANGE_BYTES = 500
+
+def response_weight(response) -> int:
+    """Rough bytes held by a cached response: its texts and change records."""
+    return (sys.getsizeof(response.original_text) + sys.getsizeof(response.humanized_text)
+            + CHANGE_BYTES * len(response.word_changes))
+
+# Complete responses keyed by (text, style, track_changes, rerank, dictionary version);
+# any dictionary or pattern edit changes the version and so misses the cache
+result_cache = metrics.REGISTRY.register_cache("result", LRUCache(
+    maxsize=int(os.environ.get("HUMANIZE_RESULT_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("HUMANIZE_RESULT_CACHE_TTL", "0")) or None,
+    maxweight=int(os.environ.get("HUMANIZE_RESULT_CACHE_BYTES", str(256 * 1024 * 1024))),
+    weigh=response_weight
+))
+
+def session_weight(session) -> int:
+    """Rough bytes held by a session: its text and every sentence with its changes."""
+    return sys.getsizeof(session.text) + sum(
+        sys.getsizeof(sentence.source) + sys.getsizeof(sentence.separator)
+        + sys.getsizeof(sentence.humanized) + CHANGE_BYTES * len(sentence.changes)
+        for sentence in session.sentences
+    )
+
+# Live editing sessions of this worker; an idle session expires after the
+# TTL, the least recently used go first over the count or byte budget, and
+# clients re-create sessions they get a 404 for
+SESSION_MAX_CHARS = int(os.environ.get("HUMANIZE_SESSION_MAX_CHARS", "1000000"))
+sessions = metrics.REGISTRY.register_cache("session", LRUCache(
+    maxsize=int(os.environ.get("HUMANIZE_SESSION_LIMIT", "1000")),
+    ttl=float(os.environ.get("HUMANIZE_SESSION_TTL", "1800")) or None,
+    maxweight=int(os.environ.get("HUMANIZE_SESSION_BYTES", str(256 * 1024 * 1024))),
+    weigh=session_weight
+))
+
+# Per-request stage timings are returned in a Server-Timing header when this
+# is set, or when the request sends TIMING_REQUEST_HEADER
+TIMING_HEADER = os.environ.get("HUMANIZE_TIMING_HEADER", "").lower() in ("1", "true", "yes")
+TIMING_REQUEST_HEADER = "x-humanize-timing"
+
+# Requests served at once per worker, and how many more may wait for a
+# slot before new ones are refused with 429
+MAX_CONCURRENCY = int(os.environ.get("HUMANIZE_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.environ.get("HUMANIZE_MAX_QUEUE", "32"))
+# Deadline of a request unless it sends x-humanize-timeout-ms, and the
+# longest one a client may ask for
+REQUEST_TIMEOUT = float(os.environ.get("HUMANIZE_REQUEST_TIMEOUT_MS", "10000")) / 1000
+MAX_REQUEST_TIMEOUT = float(os.environ.get("HUMANIZE_MAX_REQUEST_TIMEOUT_MS", "60000")) / 1000
+# Retry-After sent when the dictionary backend is unavailable
+UNAVAILABLE_RETRY_AFTER = 5
+
+# Set to a file path to record /humanize and /detect-style requests for
+# replay with traffic.py; HUMANIZE_RECORD_SAMPLE records only a fraction
+RECORD_TRAFFIC = os.environ.get("HUMANIZE_RECORD_TRAFFIC")
+RECORD_SAMPLE = float(os.environ.get("HUMANIZE_RECORD_SAMPLE", "1"))
+
+# Humanized in both styles during warm-up, so the first real request finds
+# the snapshot loaded, the automaton compiled and every code path exercised
+WARMUP_TEXTS = [
+    "Saya dapat membantu Anda mencari tahu langkah-langkah untuk meningkatkan karier.",
+    "Bagaimana cara mengevaluasi tujuan hidup melalui pengembangan pribadi?",
+    "Jika kamu ingin ngobrol santai, pertimbangkan tindakan yang disarankan ini.",
+    "Mengapa keterampilan baru berguna untuk pekerjaan dan pengembangan profesional tahun ini?"
+]
+WARMUP_MAX_RETRY_SECONDS = 60.0
+
+# Worker processes for sentence-level parallel humanization of texts of at
+# least PARALLEL_MIN_CHARS characters; 0 keeps everything in-process
+PARALLEL_WORKERS = int(os.environ.get("HUMANIZE_PARALLEL_WORKERS", "0"))
+PARALLEL_MIN_CHARS = int(os.environ.get("HUMANIZE_PARALLEL_MIN_CHARS", str(DEFAULT_PARALLEL_MIN_CHARS)))
+parallel_humanizer = None
 
 app = FastAPI(
     title="HumanizeIndo API",
     description="API for making Indonesian text more human-like and conversational",
     version="1.0.0"
 )
+app.add_middleware(
+    AdmissionControl, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE,
+    timeout=REQUEST_TIMEOUT, max_timeout=MAX_REQUEST_TIMEOUT
+)
+if RECORD_TRAFFIC:
+    app.add_middleware(TrafficRecorder, path=RECORD_TRAFFIC, sample=RECORD_SAMPLE)
+
+# Styles a request may force; anything else is rejected with 422
+Style = Literal["casual", "personal"]
 
 class HumanizeRequest(BaseModel):
     text: str = Field(..., description="The formal Indonesian text to be humanized")
-    style: Optional[str] = Field(
+    style: Optional[Style] = Field(
         None, 
         description="The desired style: 'casual' (friendly, informal) or 'personal' (polite, semi-formal). If not specified, will be auto-detected."
     )
@@ -20,6 +122,20 @@ class HumanizeRequest(BaseModel):
         False,
         description="Whether to preserve the original text casing"
     )
+    track_changes: Optional[bool] = Field(
+        True,
+        description="Whether to report word_changes; disable to skip change tracking entirely"
+    )
+    rerank: Optional[bool] = Field(
+        False,
+        description="Whether to let BERT choose among several translations of a word by context; falls back to the first within a latency budget. Ignored unless the server sets HUMANIZE_RERANK"
+    )
+
+    @field_validator("rerank")
+    @classmethod
+    def rerank_if_enabled(cls, value):
+        # Disabled rerank requests are ordinary ones, cache and pool included
+        return bool(value) and RERANK_ENABLED
 
 class HumanizeResponse(BaseModel):
     original_text: str = Field(..., description="The original input text")
@@ -27,15 +143,364 @@ class HumanizeResponse(BaseModel):
     detected_style: str = Field(..., description="The detected or forced style used")
     word_changes: List[dict] = Field(
         ..., 
-        description="List of significant word transformations applied"
+        description="List of significant word transformations applied, with source and target character spans"
+    )
+
+class HumanizeBatchRequest(BaseModel):
+    items: List[HumanizeRequest] = Field(..., description="The texts to humanize, each with its own options")
+
+class HumanizeBatchItem(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    result: Optional[HumanizeResponse] = Field(None, description="The humanized item, if it succeeded")
+    error: Optional[str] = Field(None, description="Why the item failed, if it did")
+
+class HumanizeBatchResponse(BaseModel):
+    results: List[HumanizeBatchItem] = Field(..., description="One result per item, in input order")
+    unique_items: int = Field(..., description="Number of distinct (text, style, rerank) combinations in the batch")
+
+class DetectStyleBatchRequest(BaseModel):
+    texts: List[str] = Field(..., description="The texts to classify")
+
+class DetectStyleItem(BaseModel):
+    detected_style: str = Field(..., description="The more likely style: 'casual' or 'personal'")
+    confidence: float = Field(..., description="Probability of the detected style, from 0.5 to 1")
+
+class DetectStyleBatchResponse(BaseModel):
+    results: List[DetectStyleItem] = Field(..., description="One result per text, in input order")
+
+class SessionRequest(BaseModel):
+    text: str = Field(..., description="The first revision of the document")
+    style: Optional[Style] = Field(
+        None,
+        description="Force 'casual' or 'personal' for the whole session; detected and kept up to date if not specified"
+    )
+    track_changes: Optional[bool] = Field(
+        False,
+        description="Whether to report word_changes for the sentences each edit re-humanizes"
+    )
+
+class TextEdit(BaseModel):
+    start: int = Field(..., description="Start offset of the replaced range")
+    end: int = Field(..., description="End offset of the replaced range")
+    text: str = Field(..., description="The replacement text")
+
+class SessionEditRequest(BaseModel):
+    base_revision: Optional[int] = Field(
+        None,
+        description="Revision the edit was made against; rejected with 409 if the session has moved on"
+    )
+    text: Optional[str] = Field(None, description="The new revision in full")
+    edits: Optional[List[TextEdit]] = Field(
+        None,
+        description="Non-overlapping edits with offsets into the current revision, instead of text"
+    )
+
+class SessionResponse(BaseModel):
+    session_id: str = Field(..., description="Identifier to send edits to")
+    revision: int = Field(..., description="Current revision of the document")
+    detected_style: str = Field(..., description="The detected or forced style used")
+    humanized_text: str = Field(..., description="The humanized document")
+
+class SessionEditResponse(BaseModel):
+    session_id: str = Field(..., description="Identifier to send edits to")
+    revision: int = Field(..., description="Revision after the edit")
+    detected_style: str = Field(..., description="The detected or forced style used")
+    style_changed: bool = Field(..., description="Whether the edit flipped the style, re-humanizing the whole document")
+    sentences: int = Field(..., description="Number of sentences humanized again")
+    changes: List[TextEdit] = Field(
+        ...,
+        description="Ranges of the previous humanized text to replace, with offsets into it"
+    )
+    word_changes: List[dict] = Field(
+        ...,
+        description="Significant word transformations in the re-humanized sentences, with spans into the new revision"
+    )
+
+def humanize_analysis(analysis: TextAnalysis, db: DictionaryDB, track_changes: bool = True,
+                      rerank: bool = False) -> HumanizeResponse:
+    """Translate an analyzed text and build the API response."""
+    # Translate/humanize the text
+    humanized = translate_text(analysis.text, db, analysis, track_changes=track_changes, rerank=rerank)
+    
+    return HumanizeResponse(
+        original_text=analysis.text,
+        humanized_text=humanized,
+        detected_style=analysis.style,
+        word_changes=significant_changes(analysis.changes)
     )
 
+def significant_changes(changes: List[dict]) -> List[dict]:
+    """Track significant word changes, straight from the rewriter's log."""
+    word_changes = []
+    for change in changes:
+        if change["original"].lower() != change["humanized"].lower():
+            word_changes.append(dict(change, position=len(word_changes)))
+    return word_changes
+
+def humanize_parallel(text: str, request: HumanizeRequest, humanizer: ParallelHumanizer) -> tuple:
+    """
+    Humanize a long text sentence by sentence on the worker processes;
+    returns the response and the dictionary version the workers used.
+    """
+    humanized, style, changes, version = humanizer.humanize(text, request.style, request.track_changes)
+    return HumanizeResponse(
+        original_text=text,
+        humanized_text=humanized,
+        detected_style=style,
+        word_changes=significant_changes(changes)
+    ), version
+
+def normalize_text(text: str, track_changes: bool) -> str:
+    """
+    The form of a text that is humanized and cached: whitespace runs are
+    collapsed unless changes are tracked, as those point at source offsets.
+    """
+    return text if track_changes else " ".join(text.split())
+
+def result_cache_key(text: str, style: Optional[str], track_changes: bool, version, rerank: bool = False) -> tuple:
+    """Cache key of a response for a normalized text; includes the dictionary version stamp."""
+    # Casual output is lowercased throughout, so case only matters to
+    # tracked changes and BERT (and non-ASCII text, where lowering can
+    # change the tokens)
+    if style == "casual" and not track_changes and not rerank and text.isascii():
+        text = text.lower()
+    return (text, style or None, bool(track_changes), bool(rerank), version)
+
+def with_original(response: HumanizeResponse, text: str) -> HumanizeResponse:
+    """A cached response as the answer to a request for text."""
+    if response.original_text == text:
+        return response
+    return response.model_copy(update={"original_text": text})
+
+def humanize_request(request: HumanizeRequest, db: DictionaryDB) -> HumanizeResponse:
+    """Humanize a single request end to end, reusing cached responses."""
+    text = normalize_text(request.text, request.track_changes)
+    key = result_cache_key(text, request.style, request.track_changes, db.version, request.rerank)
+    response = result_cache.get(key)
+    metrics.record_cache(response is not None)
+    if response is None:
+        # Reranking runs BERT in this process, so it never takes the pool
+        if (parallel_humanizer is not None and not request.rerank
+                and len(text) >= parallel_humanizer.min_chars):
+            response, version = humanize_parallel(text, request, parallel_humanizer)
+            if version != key[-1]:
+                # Workers still on the previous dictionary while new ones start
+                return with_original(response, request.text)
+        else:
+            # Analyze once: style (either specified or detected), tokens and rewrites
+            analysis = analyze_text(text, db, style=request.style)
+            response = humanize_analysis(analysis, db, track_changes=request.track_changes, rerank=request.rerank)
+            if request.rerank and not analysis.reranked:
+                # A budget fallback is not the answer to cache
+                return with_original(response, request.text)
+        result_cache.put(key, response)
+    return with_original(response, request.text)
+
+def humanize_items(items: List[HumanizeRequest], db: DictionaryDB) -> HumanizeBatchResponse:
+    """Humanize a batch, deduplicating (text, style, rerank) triples."""
+    analyses = {}
+    track_changes = {}
+    responses = {}
+    errors = {}
+    for item in items:
+        key = (item.text, item.style, bool(item.rerank))
+        track_changes[key] = track_changes.get(key, False) or item.track_changes
+    
+    version = db.version
+    texts = {key: normalize_text(key[0], track) for key, track in track_changes.items()}
+    for key, track in track_changes.items():
+        cached = result_cache.get(result_cache_key(texts[key], key[1], track, version, key[2]))
+        metrics.record_cache(cached is not None)
+        if cached is not None:
+            responses[key] = cached
+            continue
+        try:
+            analyses[key] = analyze_text(texts[key], db, style=key[1])
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            errors[key] = str(e)
+    
+    # One dictionary lookup shared by every text in the batch
+    entries = db.get_entries(set().union(*(a.words() for a in analyses.values())))
+    
+    for key, analysis in analyses.items():
+        analysis.entries = entries
+        try:
+            responses[key] = humanize_analysis(analysis, db, track_changes=track_changes[key], rerank=key[2])
+            if not key[2] or analysis.reranked:
+                result_cache.put(result_cache_key(texts[key], key[1], track_changes[key], version, key[2]), responses[key])
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            errors[key] = str(e)
+    
+    results = []
+    for index, item in enumerate(items):
+        key = (item.text, item.style, bool(item.rerank))
+        if key in errors:
+            results.append(HumanizeBatchItem(index=index, error=errors[key]))
+            continue
+        response = with_original(responses[key], item.text)
+        if not item.track_changes and response.word_changes:
+            response = response.model_copy(update={"word_changes": []})
+        results.append(HumanizeBatchItem(index=index, result=response))
+    
+    return HumanizeBatchResponse(results=results, unique_items=len(track_changes))
+
+async def run_within_deadline(db: DictionaryDB, func, *args):
+    """Run func on the DictionaryDB executor, abandoning it at the request deadline."""
+    call = db.run_async(func, *args)
+    left = remaining()
+    if left is None:
+        return await call
+    try:
+        # A call still queued on the executor is cancelled outright; a
+        # running one stops at its next deadline check
+        return await asyncio.wait_for(call, max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline exceeded")
+
+def http_error(e: Exception, path: str) -> HTTPException:
+    """Map a failure to the status a client can act on instead of a blanket 500."""
+    left = remaining()
+    # Mongo reports a timeout both for our deadline and for an unreachable server
+    deadline_passed = left is not None and left <= 0
+    if isinstance(e, DeadlineExceeded) or (isinstance(e, PyMongoError) and e.timeout and deadline_passed):
+        metrics.REQUESTS_SHED.inc(path=path, reason="deadline")
+        return HTTPException(status_code=504, detail=str(e) or "Deadline exceeded")
+    if isinstance(e, (PyMongoError, ConnectionError)):
+        return HTTPException(
+            status_code=503,
+            detail=f"Dictionary unavailable: {e}",
+            headers={"Retry-After": str(UNAVAILABLE_RETRY_AFTER)}
+        )
+    return HTTPException(status_code=500, detail=str(e))
+
+def create_session(request: SessionRequest, db: DictionaryDB) -> SessionResponse:
+    session = EditSession(db, request.text, style=request.style, track_changes=request.track_changes,
+                          max_chars=SESSION_MAX_CHARS)
+    sessions.put(session.id, session)
+    return session_response(session)
+
+def session_response(session: EditSession) -> SessionResponse:
+    with session.lock:
+        return SessionResponse(
+            session_id=session.id,
+            revision=session.revision,
+            detected_style=session.style,
+            humanized_text=session.humanized_text()
+        )
+
+def edit_session(session: EditSession, request: SessionEditRequest) -> SessionEditResponse:
+    """Apply an edit; edits to one session are applied one at a time."""
+    edits = None
+    if request.edits is not None:
+        edits = [(edit.start, edit.end, edit.text) for edit in request.edits]
+    with session.lock:
+        result = session.apply(text=request.text, edits=edits, base_revision=request.base_revision)
+        # Refresh the TTL and weight of a session in use
+        sessions.put(session.id, session)
+    return SessionEditResponse(
+        session_id=session.id,
+        revision=result["revision"],
+        detected_style=result["style"],
+        style_changed=result["style_changed"],
+        sentences=result["sentences"],
+        changes=result["changes"],
+        word_changes=significant_changes(result["word_changes"])
+    )
+
+def get_session(session_id: str) -> EditSession:
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    return session
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and attach its stage timings if asked to."""
+    with metrics.track_request() as stats:
+        response = await call_next(request)
+    # Label by route template, so path parameters cannot blow up cardinality
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - stats.started, path=path, method=request.method, status=response.status_code
+    )
+    metrics.REQUEST_DB_ROUND_TRIPS.observe(stats.db_round_trips, path=path)
+    if TIMING_HEADER or request.headers.get(TIMING_REQUEST_HEADER):
+        response.headers["Server-Timing"] = stats.server_timing()
+    return response
+
+def warm_up(db: DictionaryDB) -> dict:
+    """Load the snapshot, compile the automaton and humanize the sample texts."""
+    started = time.perf_counter()
+    db.get_snapshot()
+    db.get_matcher()
+    db.get_classifier()
+    for text in WARMUP_TEXTS:
+        detect_context(text, db)
+        for style in ("casual", "personal"):
+            humanize_analysis(analyze_text(text, db, style=style), db)
+    return {"seconds": round(time.perf_counter() - started, 3), "texts": len(WARMUP_TEXTS)}
+
+async def prepare_service():
+    """
+    Connect and warm up in the background, retrying with backoff.
+
+    /readyz passes only once this completes; /healthz answers throughout.
+    """
+    global parallel_humanizer
+    db = app.state.db
+    delay = 1.0
+    while True:
+        try:
+            if not await db.aconnect():
+                raise ConnectionError("Failed to load the dictionary")
+            app.state.warmup = await db.run_async(warm_up, db)
+            if RERANK_ENABLED:
+                try:
+                    await db.run_async(warm_model)
+                except Exception as e:
+                    # Rerank requests fall back and retry the load meanwhile
+                    print(f"Rerank model failed to load, rerank requests fall back until it does: {e}")
+            if PARALLEL_WORKERS and parallel_humanizer is None:
+                humanizer = ParallelHumanizer(db, workers=PARALLEL_WORKERS, min_chars=PARALLEL_MIN_CHARS)
+                try:
+                    await db.run_async(humanizer.start)
+                    parallel_humanizer = humanizer
+                except Exception as e:
+                    # Serve without the pool rather than never becoming ready
+                    humanizer.close()
+                    print(f"Parallel workers failed to start, humanizing in-process: {e}")
+            app.state.warmup_error = None
+            app.state.ready = True
+            print(f"Warm-up complete in {app.state.warmup['seconds']}s")
+            return
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            print(f"Warm-up failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_MAX_RETRY_SECONDS)
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection on startup"""
-    app.state.db = DictionaryDB()
-    if not app.state.db.connect():
-        raise Exception("Failed to connect to MongoDB database")
+    """Create the dictionary backend and start connecting and warming up"""
+    # DICTIONARY_ARTIFACT selects the read-only, Mongo-free backend
+    app.state.db = open_dictionary()
+    app.state.ready = False
+    app.state.warmup = None
+    app.state.warmup_error = None
+    app.state.warmup_task = asyncio.ensure_future(prepare_service())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release the database executor and connections"""
+    app.state.warmup_task.cancel()
+    if parallel_humanizer is not None:
+        parallel_humanizer.close()
+    app.state.db.close()
 
 @app.get("/")
 async def root():
@@ -46,11 +511,38 @@ async def root():
         "description": "Make Indonesian text more human-like and conversational",
         "endpoints": {
             "/humanize": "POST - Convert formal text to human-like text",
+            "/humanize/batch": "POST - Humanize many texts in one request",
+            "/humanize/stream": "POST - Humanize a large plain-text body as NDJSON records",
             "/detect-style": "GET - Detect the style of a text",
+            "/detect-style/batch": "POST - Detect the style of many texts in one request",
+            "/sessions": "POST - Start a live editing session; POST /sessions/{id}/edits re-humanizes only what changed",
+            "/cache/stats": "GET - Result cache size and hit/miss/eviction counters",
+            "/metrics": "GET - Prometheus metrics: stage, DB and BERT latencies, round trips, caches, tokens",
+            "/healthz": "GET - Liveness: the process is serving requests",
+            "/readyz": "GET - Readiness: the dictionary is loaded and warmed up",
             "/docs": "GET - API documentation"
         }
     }
 
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness probe; touches neither the dictionary nor the database.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe; passes once the startup warm-up has completed.
+    """
+    if getattr(app.state, "ready", False):
+        return {"status": "ready", "warmup": app.state.warmup}
+    return JSONResponse(
+        status_code=503,
+        content={"status": "warming up", "error": getattr(app.state, "warmup_error", None)}
+    )
+
 @app.post("/humanize", response_model=HumanizeResponse)
 async def humanize(request: HumanizeRequest):
     """
@@ -61,34 +553,151 @@ async def humanize(request: HumanizeRequest):
     - Maintains natural flow and context
     """
     try:
-        # Get style (either specified or detected)
-        style = request.style if request.style else detect_context(request.text, app.state.db)
-        
-        # Track word changes for transparency
-        original_words = request.text.split()
-        
-        # Translate/humanize the text
-        humanized = translate_text(request.text, app.state.db)
-        humanized_words = humanized.split()
-        
-        # Track significant word changes
-        word_changes = []
-        for orig, human in zip(original_words, humanized_words):
-            if orig.lower() != human.lower():
-                word_changes.append({
-                    "original": orig,
-                    "humanized": human,
-                    "position": len(word_changes)
-                })
-        
-        return HumanizeResponse(
-            original_text=request.text,
-            humanized_text=humanized,
-            detected_style=style,
-            word_changes=word_changes
-        )
+        db = app.state.db
+        # Lookups run on the DictionaryDB executor, never on the event loop
+        return await run_within_deadline(db, humanize_request, request, db)
+    except Exception as e:
+        raise http_error(e, "/humanize")
+
+@app.post("/humanize/batch", response_model=HumanizeBatchResponse)
+async def humanize_batch(request: HumanizeBatchRequest):
+    """
+    Humanize many texts in one call.
+    
+    - Identical (text, style, rerank) items are humanized only once
+    - Dictionary words of the whole batch are resolved in a single lookup
+    - Results keep the input order; a failing item reports its own error,
+      but a deadline that passes fails the whole batch
+    """
+    db = app.state.db
+    try:
+        return await run_within_deadline(db, humanize_items, request.items, db)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e, "/humanize/batch")
+
+@app.post("/humanize/stream")
+async def humanize_stream_endpoint(request: Request, style: Optional[Style] = None, track_changes: bool = False):
+    """
+    Humanize a large plain-text body sentence by sentence.
+    
+    - The body is spooled to disk past STREAM_SPOOL_BYTES instead of held in memory
+    - One NDJSON record is sent as soon as each sentence or paragraph is done
+    - Joining humanized_text and separator of all records rebuilds the document
+    """
+    db = app.state.db
+    body = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES)
+    async for data in request.stream():
+        body.write(data)
+    body.seek(0)
+    
+    def pieces():
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        for data in iter(lambda: body.read(STREAM_READ_BYTES), b""):
+            yield decoder.decode(data)
+        yield decoder.decode(b"", final=True)
+    
+    def records():
+        # Runs in the threadpool, so translation does not block the event loop
+        try:
+            for record in humanize_stream(pieces(), db, style=style, track_changes=track_changes):
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+        except DeadlineExceeded as e:
+            # The status is already sent; end the stream with an error record
+            metrics.REQUESTS_SHED.inc(path="/humanize/stream", reason="deadline")
+            yield json.dumps({"error": str(e)}) + "\n"
+        except Exception as e:
+            print(f"Stream humanization failed: {e!r}")
+            yield json.dumps({"error": str(e) or type(e).__name__}) + "\n"
+        finally:
+            body.close()
+    
+    return StreamingResponse(records(), media_type="application/x-ndjson")
+
+@app.post("/sessions", response_model=SessionResponse)
+async def start_session(request: SessionRequest):
+    """
+    Start a live editing session for a document.
+    
+    - The document is humanized sentence by sentence and kept in memory
+    - Send later revisions to /sessions/{session_id}/edits
+    - Sessions live in one worker; route a session's requests to the same one
+    - Documents longer than HUMANIZE_SESSION_MAX_CHARS are rejected with 422
+    """
+    db = app.state.db
+    try:
+        return await run_within_deadline(db, create_session, request, db)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise http_error(e, "/sessions")
+
+@app.post("/sessions/{session_id}/edits", response_model=SessionEditResponse)
+async def edit_session_endpoint(session_id: str, request: SessionEditRequest):
+    """
+    Re-humanize a session after an edit.
+    
+    - Send either the new revision in full (text) or edits against the current one
+    - Only the sentences the edit touches are humanized again
+    - The style is kept unless the edit flips it, which redoes the whole document
+    - The response lists only the spans of the humanized text that changed
+    """
+    if (request.text is None) == (request.edits is None):
+        raise HTTPException(status_code=422, detail="Send either text or edits")
+    session = get_session(session_id)
+    try:
+        return await run_within_deadline(app.state.db, edit_session, session, request)
+    except RevisionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise http_error(e, "/sessions")
+
+@app.get("/sessions/{session_id}", response_model=SessionResponse)
+async def session_state(session_id: str):
+    """
+    Return the current revision and humanized text of a session, e.g. to resynchronize.
+    """
+    session = get_session(session_id)
+    try:
+        # Waits for an edit in progress without blocking the event loop
+        return await run_within_deadline(app.state.db, session_response, session)
+    except Exception as e:
+        raise http_error(e, "/sessions")
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    """
+    End a session and free its memory.
+    """
+    if sessions.pop(session_id) is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found or expired")
+    return {"session_id": session_id, "deleted": True}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Report result cache size and hit, miss and eviction counters.
+    """
+    return result_cache.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """
+    Expose latency histograms and counters in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def detect_styles(texts: List[str], db: DictionaryDB) -> dict:
+    """Classify texts in one vectorized pass over the classifier."""
+    with metrics.stage("detect_context"):
+        predictions = db.get_classifier().classify_many(texts)
+    return {
+        "results": [
+            {"detected_style": style, "confidence": round(confidence, 3)}
+            for style, confidence in predictions
+        ]
+    }
 
 @app.get("/detect-style")
 async def detect_style(text: str):
@@ -96,14 +705,26 @@ async def detect_style(text: str):
     Detect whether the text is casual, personal, or formal in style.
     """
     try:
-        style = detect_context(text, app.state.db)
+        db = app.state.db
+        style, confidence = await run_within_deadline(db, classify_style, text, db)
         return {
             "text": text,
             "detected_style": style,
-            "confidence": "high" if len(text.split()) > 5 else "medium"
+            "confidence": round(confidence, 3)
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise http_error(e, "/detect-style")
+
+@app.post("/detect-style/batch", response_model=DetectStyleBatchResponse)
+async def detect_style_batch(request: DetectStyleBatchRequest):
+    """
+    Detect the style of many texts in one call.
+    """
+    try:
+        db = app.state.db
+        return await run_within_deadline(db, detect_styles, request.texts, db)
+    except Exception as e:
+        raise http_error(e, "/detect-style/batch")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,334 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond lookups to slow BERT batches
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name + "_total", _format_labels(self.labelnames, key), value
+
+
+class Gauge:
+    """Value that goes up and down, optionally split by labels."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.labelnames), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally split by labels."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = (("le", _format_value(float(bound))),)
+                yield self.name + "_bucket", _format_labels(self.labelnames, key, le), cumulative
+            yield self.name + "_sum", _format_labels(self.labelnames, key), total
+            yield self.name + "_count", _format_labels(self.labelnames, key), count
+
+
+class Registry:
+    """
+    Metrics and LRU caches rendered together in the Prometheus text format.
+
+    Caches are read at render time from their own counters, so the hot
+    path pays nothing extra for them.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_cache(self, name, cache):
+        with self._lock:
+            self._caches[name] = cache
+        return cache
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        caches = sorted(self._caches.items())
+        for field, kind, documentation in (
+            ("hits", "counter", "Cache lookups that found an entry"),
+            ("misses", "counter", "Cache lookups that found nothing"),
+            ("evictions", "counter", "Entries evicted to stay within maxsize or maxweight"),
+            ("size", "gauge", "Entries currently cached"),
+            ("weight", "gauge", "Estimated bytes currently cached, for caches that weigh entries")
+        ):
+            name = f"humanize_cache_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache_name, cache in caches:
+                lines.append(f'{name}{{cache="{_escape(cache_name)}"}} {cache.stats()[field]}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "humanize_stage_seconds", "Time spent in each stage of the humanization pipeline", ["stage"]))
+DB_CALL_SECONDS = REGISTRY.register(Histogram(
+    "humanize_db_call_seconds", "Duration of DictionaryDB method calls", ["method"]))
+MONGO_COMMAND_SECONDS = REGISTRY.register(Histogram(
+    "humanize_mongo_command_seconds", "Duration of MongoDB round trips", ["command", "outcome"]))
+BERT_INFERENCE_SECONDS = REGISTRY.register(Histogram(
+    "humanize_bert_inference_seconds", "Duration of BERT forward passes", ["task"]))
+BERT_BATCH_SIZE = REGISTRY.register(Histogram(
+    "humanize_bert_batch_size", "Texts per BERT forward pass", ["task"], buckets=COUNT_BUCKETS))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "humanize_request_seconds", "End-to-end HTTP request latency", ["path", "method", "status"]))
+REQUEST_DB_ROUND_TRIPS = REGISTRY.register(Histogram(
+    "humanize_request_db_round_trips", "MongoDB round trips made while serving one request", ["path"],
+    buckets=COUNT_BUCKETS))
+# Values of the style label of TOKENS_PROCESSED; any other style is "other"
+TOKEN_STYLES = ("casual", "personal")
+TOKENS_PROCESSED = REGISTRY.register(Counter(
+    "humanize_tokens_processed", "Word and punctuation tokens translated", ["style"]))
+RERANK_SLOTS = REGISTRY.register(Counter(
+    "humanize_rerank_slots", "Words with several translations seen by BERT reranking", ["outcome"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "humanize_requests_in_flight", "Admitted requests being served by this worker"))
+REQUESTS_QUEUED = REGISTRY.register(Gauge(
+    "humanize_requests_queued", "Requests waiting for an admission slot"))
+REQUESTS_SHED = REGISTRY.register(Counter(
+    "humanize_requests_shed", "Requests refused or abandoned to bound latency", ["path", "reason"]))
+
+
+class RequestStats:
+    """
+    Per-request accounting: time per stage, DB calls and round trips, cache
+    hits and misses, tokens. Shared with every thread the request runs on
+    through a context variable.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.db_calls = 0
+        self.db_round_trips = 0
+        self.db_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.tokens = 0
+
+    def add_stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self):
+        """Render the stats as a Server-Timing header value."""
+        total = time.perf_counter() - self.started
+        entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages.items()]
+        entries.append(f'db;desc="{self.db_calls} calls, {self.db_round_trips} round trips";dur={self.db_seconds * 1000:.3f}')
+        entries.append(f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"')
+        entries.append(f'tokens;desc="{self.tokens}"')
+        entries.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(entries)
+
+
+_current_request = contextvars.ContextVar("humanize_request_stats", default=None)
+
+
+def current_request():
+    """Stats of the request being served, or None outside of one."""
+    return _current_request.get()
+
+
+@contextlib.contextmanager
+def track_request():
+    """Collect RequestStats for everything run in this context."""
+    stats = RequestStats()
+    token = _current_request.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_request.reset(token)
+
+
+def observe_stage(name, seconds):
+    """Record time spent in a pipeline stage, globally and for the current request."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.add_stage(name, seconds)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the enclosed block as one pipeline stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+
+class StageTimer:
+    """Time consecutive stages of one function: call lap() as each ends."""
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        observe_stage(name, now - self._last)
+        self._last = now
+
+
+_db_call_state = threading.local()
+
+
+def db_call(func):
+    """
+    Decorator timing a DictionaryDB method.
+
+    Only the outermost call is recorded, so e.g. get_matcher is not also
+    counted as the get_snapshot it makes internally.
+    """
+    method = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_db_call_state, "active", False):
+            return func(*args, **kwargs)
+        _db_call_state.active = True
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _db_call_state.active = False
+            elapsed = time.perf_counter() - started
+            DB_CALL_SECONDS.observe(elapsed, method=method)
+            stats = _current_request.get()
+            if stats is not None:
+                stats.db_calls += 1
+                stats.db_seconds += elapsed
+    return wrapper
+
+
+def record_round_trip(command, seconds, outcome="ok"):
+    MONGO_COMMAND_SECONDS.observe(seconds, command=command, outcome=outcome)
+    stats = _current_request.get()
+    if stats is not None:
+        stats.db_round_trips += 1
+
+
+def record_cache(hit):
+    stats = _current_request.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def record_tokens(count, style):
+    # The style can come from request input; keep the label bounded
+    TOKENS_PROCESSED.inc(count, style=style if style in TOKEN_STYLES else "other")
+    stats = _current_request.get()
+    if stats is not None:
+        stats.tokens += count
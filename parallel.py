@@ -0,0 +1,256 @@
+import argparse
+import contextlib
+import itertools
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Optional, Tuple
+
+import admission
+from dictionary_artifact import ArtifactDictionaryDB, open_dictionary
+from dictionary_db import DictionaryDB, InMemoryDictionaryDB
+from test_indobert import analyze_text, assemble_text, detect_context, split_sentences, translate_pieces, translate_text
+
+# Documents shorter than this are humanized in the calling process
+PARALLEL_MIN_CHARS = 20000
+# Upper bound on the text sent to a worker per task
+BATCH_CHARS = 16000
+
+# Read-only dictionary of a worker process, opened by _init_worker
+_worker_db = None
+
+
+def dictionary_spec(db: DictionaryDB) -> tuple:
+    """
+    Describe db so worker processes can open a read-only copy of it.
+
+    Artifacts are mapped by path, so every worker shares the page cache;
+    any other backend is shipped as the documents of its current snapshot.
+    """
+    if isinstance(db, ArtifactDictionaryDB):
+        return ("artifact", db.artifact_path)
+    snapshot = db.get_snapshot()
+    return ("memory", [entry.to_document() for entry in snapshot.words.values()], snapshot.patterns)
+
+
+def _init_worker(spec: tuple) -> None:
+    global _worker_db
+    if spec[0] == "artifact":
+        db = ArtifactDictionaryDB(spec[1])
+    else:
+        db = InMemoryDictionaryDB(spec[1], spec[2])
+    with contextlib.redirect_stdout(sys.stderr):
+        db.connect()
+    # Compile the automaton and classifier once per worker, not on its first task
+    db.get_matcher()
+    db.get_classifier()
+    _worker_db = db
+
+
+def _ready(_=None) -> int:
+    return os.getpid()
+
+
+def translate_chunks(db: DictionaryDB, chunks: List[str], style: str) -> List[tuple]:
+    """Translate sentences in a fixed style; returns (pieces, origins) per sentence."""
+    results = []
+    for chunk in chunks:
+        analysis = analyze_text(chunk, db, style=style)
+        results.append(translate_pieces(chunk, db, analysis))
+    return results
+
+
+def _translate_batch(chunks: List[str], style: str) -> List[tuple]:
+    return translate_chunks(_worker_db, chunks, style)
+
+
+def batch_chunks(chunks: List[tuple], batch_chars: int) -> List[List[str]]:
+    """Group consecutive sentences into tasks of about batch_chars characters."""
+    batches = []
+    batch, size = [], 0
+    for _, chunk, _ in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= batch_chars:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class ParallelHumanizer:
+    """
+    Humanizes large documents sentence by sentence across worker processes.
+
+    The style is detected once for the whole document; sentences are split
+    at the same boundaries as humanize_stream and translated on the pool
+    in contiguous batches. Their pieces are joined and case-folded in one
+    assemble_text pass, so the output is exactly that of translate_text
+    on the whole document. Each worker holds a read-only copy of the
+    dictionary with its automaton compiled. When the dictionary version
+    changes, a new pool is started in the background while the old one
+    keeps serving. Documents below min_chars skip the pool.
+    """
+    def __init__(self, db: DictionaryDB, workers: Optional[int] = None,
+                 min_chars: int = PARALLEL_MIN_CHARS, batch_chars: int = BATCH_CHARS):
+        self.db = db
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chars = min_chars
+        self.batch_chars = batch_chars
+        self._pool = None
+        self._version = None
+        self._in_flight = {}  # pool -> maps running on it
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def _new_pool(self) -> Tuple[ProcessPoolExecutor, object]:
+        version = self.db.version
+        # spawn, not fork: the parent runs executor and pymongo threads
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(dictionary_spec(self.db),)
+        )
+        return pool, version
+
+    def _acquire(self) -> Tuple[ProcessPoolExecutor, object]:
+        """The current pool and its dictionary version, held until _release."""
+        version = self.db.version
+        with self._lock:
+            if self._pool is None:
+                self._pool, self._version = self._new_pool()
+            elif version != self._version and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name="parallel-rebuild", daemon=True).start()
+            pool = self._pool
+            self._in_flight[pool] = self._in_flight.get(pool, 0) + 1
+            return pool, self._version
+
+    def _release(self, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            self._in_flight[pool] -= 1
+            if self._in_flight[pool] == 0:
+                del self._in_flight[pool]
+                if pool is not self._pool:
+                    pool.shutdown(wait=False)
+
+    def _rebuild(self) -> None:
+        """Start workers on the new dictionary, then swap them in."""
+        try:
+            pool, version = self._new_pool()
+            list(pool.map(_ready, range(self.workers)))
+        except Exception as e:
+            print(f"Restarting parallel workers failed, keeping the current ones: {e}")
+            with self._lock:
+                self._rebuilding = False
+            return
+        with self._lock:
+            old = self._pool
+            self._pool, self._version = pool, version
+            self._rebuilding = False
+            # Maps still running on the old pool shut it down when they finish
+            if old is not None and old not in self._in_flight:
+                old.shutdown(wait=False)
+
+    def start(self) -> None:
+        """Start the workers and wait until each has loaded the dictionary."""
+        pool, _ = self._acquire()
+        try:
+            list(pool.map(_ready, range(self.workers)))
+        finally:
+            self._release(pool)
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in {self._pool, *self._in_flight} - {None}:
+                pool.shutdown(wait=False)
+            self._pool = None
+            self._in_flight.clear()
+
+    def humanize(self, text: str, style: Optional[str] = None,
+                 track_changes: bool = False) -> Tuple[str, str, list, object]:
+        """
+        Humanize a document; returns (humanized text, style, changes, version
+        of the dictionary used), which lags db.version while a pool restarts.
+
+        Change spans refer to the whole document, as with translate_text.
+        """
+        style = style or detect_context(text, self.db)
+        chunks = list(split_sentences([text]))
+        if len(text) < self.min_chars or self.workers < 2 or len(chunks) < 2:
+            version = self.db.version
+            analysis = analyze_text(text, self.db, style=style)
+            humanized = translate_text(text, self.db, analysis, track_changes=track_changes)
+            return humanized, style, analysis.changes, version
+
+        # Several tasks per worker, so one slow batch does not leave cores idle
+        batch_chars = max(1000, min(self.batch_chars, len(text) // (self.workers * 4)))
+        batches = batch_chunks(chunks, batch_chars)
+        # Batches not started by the request deadline are cancelled
+        left = admission.remaining()
+        pool, version = self._acquire()
+        try:
+            mapped = pool.map(
+                _translate_batch, batches, itertools.repeat(style),
+                timeout=None if left is None else max(left, 0)
+            )
+            results = [result for batch in mapped for result in batch]
+        except FutureTimeoutError:
+            raise admission.DeadlineExceeded("Deadline exceeded in parallel humanization")
+        finally:
+            self._release(pool)
+
+        # Origins are relative to their sentence; shift them into the document
+        pieces = []
+        origins = []
+        for (offset, _, _), (chunk_pieces, chunk_origins) in zip(chunks, results):
+            pieces.extend(chunk_pieces)
+            origins.extend(
+                None if origin is None else (origin[0] + offset, origin[1] + offset) + origin[2:]
+                for origin in chunk_origins
+            )
+        humanized, changes = assemble_text(text, pieces, origins, style, track_changes)
+        return humanized, style, changes, version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Humanize a large document across a process pool")
+    parser.add_argument("path", help="text file to humanize ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("--style", choices=["casual", "personal"], help="force a style instead of detecting it")
+    parser.add_argument("--artifact", help="dictionary artifact to use instead of MongoDB")
+    args = parser.parse_args(argv)
+
+    db = open_dictionary(args.artifact)
+    # stdout carries the humanized text, so status messages go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        connected = db.connect()
+    if not connected:
+        return 1
+    text = sys.stdin.read() if args.path == "-" else open(args.path, encoding="utf-8").read()
+
+    humanizer = ParallelHumanizer(db, workers=args.workers, min_chars=0)
+    started = time.perf_counter()
+    humanizer.start()
+    ready = time.perf_counter()
+    humanized, style, _, _ = humanizer.humanize(text, style=args.style)
+    done = time.perf_counter()
+    humanizer.close()
+
+    sys.stdout.write(humanized)
+    print(
+        f"{len(text)} chars, style {style}, {args.workers} workers: "
+        f"started in {ready - started:.2f}s, humanized in {done - ready:.3f}s "
+        f"({len(text) / max(done - ready, 1e-9) / 1e6:.2f} MB/s)",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
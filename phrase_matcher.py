@@ -0,0 +1,118 @@
+from collections import deque, namedtuple
+
+PhraseMatch = namedtuple("PhraseMatch", ["start", "end", "phrase", "kind", "entry"])
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+def _lower_preserving_length(text):
+    """Lowercase text without changing its length, so offsets stay valid."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+def select_longest(matches):
+    """Pick non-overlapping matches, preferring the leftmost-longest one."""
+    selected = []
+    position = 0
+    for match in sorted(matches, key=lambda m: (m.start, m.start - m.end)):
+        if match.start >= position:
+            selected.append(match)
+            position = match.end
+    return selected
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over dictionary phrases and sentence patterns.
+
+    Every phrase is registered under one or more kinds (e.g. "phrases",
+    "pattern"), so a single compiled automaton finds all rewrites of
+    analyze_text in one pass. Matching is case-insensitive and only
+    reports matches on word boundaries.
+    """
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # phrases ending at each state
+        self._payloads = {}  # phrase -> {kind: entry}
+        self._compiled = False
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def add(self, phrase, kind, entry=None):
+        """
+        Register a phrase under a kind; the first entry per kind wins
+        """
+        key = " ".join(phrase.split()).lower()
+        if not key:
+            return
+        kinds = self._payloads.get(key)
+        if kinds is None:
+            kinds = self._payloads[key] = {}
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(key)
+            self._compiled = False
+        kinds.setdefault(kind, entry)
+
+    def compile(self):
+        """
+        Build the failure links; called automatically on first use
+        """
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._compiled = True
+        return self
+
+    def find_all(self, text, kinds=None):
+        """
+        Return every word-bounded match in a single pass over the text
+        """
+        if not self._compiled:
+            self.compile()
+        lowered = _lower_preserving_length(text)
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for end, char in enumerate(lowered, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if not output[state]:
+                continue
+            if end < len(text) and _is_word_char(text[end]):
+                continue
+            for key in output[state]:
+                start = end - len(key)
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                for kind, entry in self._payloads[key].items():
+                    if kinds is None or kind in kinds:
+                        matches.append(PhraseMatch(start, end, key, kind, entry))
+        return matches
@@ -0,0 +1,302 @@
+import bisect
+import threading
+import uuid
+from typing import List, Optional, Tuple
+
+from dictionary_db import DictionaryDB
+from test_indobert import SentenceSplitter, analyze_text, split_sentences, translate_text
+
+
+class RevisionConflict(Exception):
+    """An edit was made against a revision the session has moved past."""
+
+
+class Sentence:
+    """One sentence of a session document, with its humanized form."""
+    __slots__ = ("source", "separator", "humanized", "changes", "evidence")
+
+    def __init__(self, source: str, separator: str):
+        self.source = source
+        self.separator = separator
+        self.humanized = source
+        self.changes = []
+        # Style classifier score of the sentence; the document's is the sum
+        self.evidence = 0.0
+
+    def output(self) -> str:
+        return self.humanized + self.separator
+
+
+def split_region(text: str, start: int, end: int) -> Optional[List[Sentence]]:
+    """
+    Split text[start:end], which starts at a sentence boundary, into
+    sentences covering it exactly.
+
+    Returns None if end is not a boundary where splitting the whole text
+    would put one, i.e. the region needs to grow.
+    """
+    region = text[start:end]
+    complete = end >= len(text)
+    if complete:
+        chunks = list(split_sentences([region]))
+    else:
+        # With the next character in view the splitter only emits sentences
+        # whose boundary does not depend on what follows
+        chunks = SentenceSplitter().feed(region + text[end])
+    sentences = []
+    position = 0
+    for offset, chunk, separator in chunks:
+        if chunk:
+            sentences.append(Sentence(chunk, separator))
+        else:
+            _append_gap(sentences, separator)
+        position = offset + len(chunk) + len(separator)
+    if position != len(region):
+        return None
+    return sentences
+
+
+def _append_gap(sentences: List[Sentence], gap: str) -> None:
+    """Fold whitespace-only chunks into the previous sentence's separator."""
+    if sentences:
+        sentences[-1].separator += gap
+    else:
+        sentences.append(Sentence("", gap))
+
+
+def diff_range(old: str, new: str) -> Tuple[int, int, int]:
+    """
+    Smallest changed range between two revisions: (start, old end, new end).
+    """
+    # Binary search on slices compares in C instead of char by char
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old.startswith(new[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    prefix = low
+    low, high = 0, min(len(old), len(new)) - prefix
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old.endswith(new[len(new) - middle:]):
+            low = middle
+        else:
+            high = middle - 1
+    return prefix, len(old) - low, len(new) - low
+
+
+def check_edits(text: str, edits: List[tuple]) -> List[tuple]:
+    """
+    Sort (start, end, replacement) edits, all against text, by position.
+
+    Raises ValueError for edits out of range or overlapping each other.
+    """
+    edits = sorted(edits, key=lambda edit: (edit[0], edit[1]))
+    position = 0
+    for start, end, _ in edits:
+        if not 0 <= start <= end <= len(text):
+            raise ValueError(f"Edit ({start}, {end}) is outside the text (length {len(text)})")
+        if start < position:
+            raise ValueError(f"Edit ({start}, {end}) overlaps a previous edit")
+        position = end
+    return edits
+
+
+class EditSession:
+    """
+    A document being edited live, humanized incrementally.
+
+    The document is held as sentences split at the same boundaries as
+    humanize_stream, each with its humanized text and style evidence.
+    An edit re-splits only the sentences it touches, widened until the
+    split agrees with splitting the whole new text, and re-humanizes just
+    those. Style evidence is additive over sentences, so a flip is noticed
+    from the running total without rescanning; only a flip or a dictionary update
+    re-humanizes the whole document. A revision that fails part way (e.g.
+    at its deadline) is rolled back, leaving the session as it was.
+    """
+    def __init__(self, db: DictionaryDB, text: str, style: Optional[str] = None, track_changes: bool = False,
+                 max_chars: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.max_chars = max_chars
+        self._check_length(len(text))
+        self.db = db
+        self.forced_style = style
+        self.track_changes = track_changes
+        self.lock = threading.Lock()
+        self.revision = 0
+        self.text = ""
+        self.style = style or "casual"
+        self.sentences = []
+        self._evidence = 0.0
+        self._version = None
+        self._rebuild(text)
+
+    def _check_length(self, length: int) -> None:
+        if self.max_chars is not None and length > self.max_chars:
+            raise ValueError(f"Session documents are limited to {self.max_chars} characters, got {length}")
+
+    def humanized_text(self) -> str:
+        return "".join(sentence.output() for sentence in self.sentences)
+
+    def _detect_style(self, evidence: float) -> str:
+        return self.forced_style or self.db.get_classifier().style(evidence)
+
+    def _analyze(self, sentence: Sentence, style: str):
+        if not sentence.source.strip():
+            sentence.evidence = 0.0
+            return None
+        analysis = analyze_text(sentence.source, self.db, style=style)
+        sentence.evidence = analysis.evidence
+        return analysis
+
+    def _humanize(self, sentence: Sentence, analysis) -> None:
+        if analysis is None:
+            sentence.humanized, sentence.changes = sentence.source, []
+            return
+        sentence.humanized = translate_text(sentence.source, self.db, analysis, track_changes=self.track_changes)
+        sentence.changes = analysis.changes
+
+    def _rebuild(self, text: str) -> Tuple[dict, List[Sentence]]:
+        """Humanize text from scratch, replacing the whole output."""
+        version = self.db.version
+        sentences = split_region(text, 0, len(text))
+        # Evidence does not depend on the style, so one pass finds it
+        analyses = [self._analyze(sentence, self.style) for sentence in sentences]
+        evidence = sum(sentence.evidence for sentence in sentences)
+        style = self._detect_style(evidence)
+        if style != self.style:
+            analyses = [self._analyze(sentence, style) for sentence in sentences]
+        for sentence, analysis in zip(sentences, analyses):
+            self._humanize(sentence, analysis)
+
+        previous_length = sum(len(sentence.output()) for sentence in self.sentences)
+        self.sentences, self._evidence = sentences, evidence
+        self.text, self.style, self._version = text, style, version
+        return {"start": 0, "end": previous_length, "text": self.humanized_text()}, sentences
+
+    def _replace(self, start: int, end: int, replacement: str) -> Tuple[Optional[dict], List[Sentence]]:
+        """
+        Apply one edit, re-humanizing the sentences it touches; returns the
+        output change, if any, and the sentences humanized again.
+        """
+        new_text = self.text[:start] + replacement + self.text[end:]
+        # Source offsets of the sentences, and the range of them to replace:
+        # from the one holding the character before the edit to the one
+        # holding the first character after it
+        offsets = [0]
+        for sentence in self.sentences:
+            offsets.append(offsets[-1] + len(sentence.source) + len(sentence.separator))
+        last = len(self.sentences) - 1
+        first = max(0, min(bisect.bisect_right(offsets, max(start - 1, 0)) - 1, last))
+        while first > 0 and not self.sentences[first].source[:1].strip():
+            first -= 1
+        stop = max(first, min(bisect.bisect_right(offsets, end) - 1, last))
+        delta = len(new_text) - len(self.text)
+        while True:
+            region_end = len(new_text) if stop >= last else offsets[stop + 1] + delta
+            sentences = split_region(new_text, offsets[first], region_end)
+            if sentences is not None:
+                break
+            stop += 1
+        replaced = self.sentences[first:stop + 1]
+
+        analyses = [self._analyze(sentence, self.style) for sentence in sentences]
+        evidence = (self._evidence - sum(sentence.evidence for sentence in replaced)
+                    + sum(sentence.evidence for sentence in sentences))
+        if self._detect_style(evidence) != self.style:
+            return self._rebuild(new_text)
+
+        for sentence, analysis in zip(sentences, analyses):
+            self._humanize(sentence, analysis)
+        output_start = sum(len(sentence.output()) for sentence in self.sentences[:first])
+        previous = "".join(sentence.output() for sentence in replaced)
+        output = "".join(sentence.output() for sentence in sentences)
+        self.sentences[first:stop + 1] = sentences
+        self._evidence = evidence
+        self.text = new_text
+
+        # Report only the characters that differ
+        prefix, previous_end, output_end = diff_range(previous, output)
+        if prefix == previous_end and prefix == output_end:
+            return None, sentences
+        change = {"start": output_start + prefix, "end": output_start + previous_end, "text": output[prefix:output_end]}
+        return change, sentences
+
+    def apply(self, text: Optional[str] = None, edits: Optional[List[tuple]] = None,
+              base_revision: Optional[int] = None) -> dict:
+        """
+        Bring the session to a new revision, given as the full text or as
+        (start, end, replacement) edits against the current one.
+
+        Returns the new revision and style, and the changes to the previous
+        humanized text as {"start", "end", "text"} replacements, to be
+        applied in the order given.
+        """
+        if base_revision is not None and base_revision != self.revision:
+            raise RevisionConflict(f"Session is at revision {self.revision}, not {base_revision}")
+        if edits is None:
+            start, old_end, new_end = diff_range(self.text, text)
+            edits = [(start, old_end, text[start:new_end])] if start < old_end or start < new_end else []
+        else:
+            edits = check_edits(self.text, edits)
+        self._check_length(len(self.text) + sum(len(replacement) - (end - start) for start, end, replacement in edits))
+
+        saved = (self.sentences[:], self.text, self.style, self._evidence, self._version)
+        style = self.style
+        changes = []
+        redone = []
+        try:
+            if self.db.version != self._version:
+                # Every translation may be stale; apply the edits and start over
+                new_text = self.text
+                for start, end, replacement in reversed(edits):
+                    new_text = new_text[:start] + replacement + new_text[end:]
+                edits = [(0, len(self.text), new_text)]
+                updates = [self._rebuild(new_text)]
+            else:
+                # Last edit first, so the offsets of the others stay valid
+                updates = [self._replace(start, end, replacement) for start, end, replacement in reversed(edits)]
+        except BaseException:
+            self.sentences, self.text, self.style, self._evidence, self._version = saved
+            raise
+        for change, sentences in updates:
+            if change is not None:
+                changes.append(change)
+            redone.extend(sentences)
+        if edits:
+            self.revision += 1
+        return self._result(changes, redone, style != self.style)
+
+    def _result(self, changes: List[dict], redone: List[Sentence], style_changed: bool) -> dict:
+        """
+        Describe a revision, with the word changes of the sentences humanized
+        again and still in the document.
+        """
+        redone = {id(sentence) for sentence in redone}
+        current = 0
+        word_changes = []
+        source_offset = output_offset = 0
+        for sentence in self.sentences:
+            if id(sentence) in redone:
+                current += 1
+                for change in sentence.changes:
+                    source_start, source_end = change["source_span"]
+                    target_start, target_end = change["target_span"]
+                    word_changes.append(dict(
+                        change,
+                        source_span=(source_offset + source_start, source_offset + source_end),
+                        target_span=(output_offset + target_start, output_offset + target_end)
+                    ))
+            source_offset += len(sentence.source) + len(sentence.separator)
+            output_offset += len(sentence.humanized) + len(sentence.separator)
+        return {
+            "revision": self.revision,
+            "style": self.style,
+            "style_changed": style_changed,
+            "sentences": current,
+            "changes": changes,
+            "word_changes": word_changes
+        }
@@ -0,0 +1,152 @@
+import math
+import re
+
+# Word and punctuation tokens; test_indobert.tokenize splits text the same way
+TOKEN_PATTERN = re.compile(r'\b\w+\b|[^\w\s]')
+
+# Dictionary categories the weight table is built from
+CONTEXT_CATEGORIES = ("formal_context", "casual_context")
+REGISTER_CATEGORIES = ("pronouns", "verbs")
+CLASSIFIER_CATEGORIES = CONTEXT_CATEGORIES + REGISTER_CATEGORIES
+
+# Log-odds of the personal style added per occurrence. Context keywords
+# weigh most; casual and personal forms of pronouns and verbs (gue, lu,
+# mikirin / aku) lean the other way. The formal source words themselves
+# are what every input is made of, so they carry no weight. All weights
+# are multiples of 0.5, so sums over sentences stay exact.
+CONTEXT_WEIGHT = 3.0
+REGISTER_WEIGHT = 1.0
+# Log-odds of the personal style without any evidence: casual, as before
+BIAS = -0.5
+
+
+def token_key(phrase):
+    """Lowercased tokens of a phrase, joined the way the table is keyed."""
+    return " ".join(token.lower() for token in TOKEN_PATTERN.findall(phrase))
+
+
+def _sigmoid(value):
+    if value >= 0:
+        return 1.0 / (1.0 + math.exp(-value))
+    exp = math.exp(value)
+    return exp / (1.0 + exp)
+
+
+class StyleClassifier:
+    """
+    Logistic casual/personal style model over a token-weight table.
+
+    Weights are keyed by single tokens or multi-token phrases. A text is
+    scored in one pass over its tokens, taking the longest table phrase at
+    each position; the evidence is the sum of their weights, and the
+    probability of the personal style is sigmoid(bias + evidence).
+    Evidence is additive, so the score of a document is the sum of the
+    scores of its sentences.
+    """
+    def __init__(self, weights, bias=BIAS):
+        self.weights = {key: weight for key, weight in weights.items() if key and weight}
+        self.bias = bias
+        self.max_length = max((key.count(" ") + 1 for key in self.weights), default=1)
+        # First tokens of multi-token phrases; other tokens need one lookup
+        self._starts = {key.split(" ", 1)[0] for key in self.weights if " " in key}
+        self._ids = {key: index for index, key in enumerate(self.weights)}
+        self._weight_array = None
+
+    @classmethod
+    def from_categories(cls, categories, bias=BIAS):
+        """
+        Build the weight table from dictionary entries by category:
+        formal_context and casual_context keywords, and the casual and
+        personal options of pronouns and verbs.
+        """
+        weights = {}
+
+        def add(keys, weight):
+            for key in keys:
+                weights[key] = weights.get(key, 0.0) + weight
+
+        add({token_key(entry.word) for entry in categories.get("formal_context", [])}, CONTEXT_WEIGHT)
+        add({token_key(entry.word) for entry in categories.get("casual_context", [])}, -CONTEXT_WEIGHT)
+
+        sources, casual, personal = set(), set(), set()
+        for category in REGISTER_CATEGORIES:
+            for entry in categories.get(category, []):
+                sources.add(token_key(entry.word))
+                casual.update(token_key(option) for option in entry.options("casual"))
+                personal.update(token_key(option) for option in entry.options("personal"))
+        # A form that is also a source word, or used in both styles, says nothing
+        add(casual - personal - sources, -REGISTER_WEIGHT)
+        add(personal - casual - sources, REGISTER_WEIGHT)
+        return cls(weights, bias)
+
+    def features(self, words):
+        """Table keys found in a sequence of lowercased tokens, leftmost-longest."""
+        weights = self.weights
+        i = 0
+        count = len(words)
+        while i < count:
+            word = words[i]
+            if word in self._starts:
+                for length in range(min(self.max_length, count - i), 1, -1):
+                    key = " ".join(words[i:i + length])
+                    if key in weights:
+                        yield key
+                        i += length
+                        break
+                else:
+                    if word in weights:
+                        yield word
+                    i += 1
+                continue
+            if word in weights:
+                yield word
+            i += 1
+
+    def evidence(self, words):
+        """Log-odds the tokens add towards the personal style, without the bias."""
+        return sum(self.weights[key] for key in self.features(words))
+
+    def style(self, evidence):
+        """Style for a total evidence: personal when it outweighs the bias."""
+        return "personal" if self.bias + evidence > 0 else "casual"
+
+    def predict(self, evidence):
+        """(style, confidence) for a total evidence; confidence is P(style)."""
+        personal = _sigmoid(self.bias + evidence)
+        if personal > 0.5:
+            return "personal", personal
+        return "casual", 1.0 - personal
+
+    def words(self, text):
+        return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+    def classify(self, text):
+        """Classify one text; returns (style, confidence)."""
+        return self.predict(self.evidence(self.words(text)))
+
+    def classify_many(self, texts):
+        """
+        Classify many texts; returns a (style, confidence) pair per text.
+
+        Matched features of all texts are gathered first, then scored in
+        one vectorized weighted bincount.
+        """
+        import numpy as np
+        if self._weight_array is None:
+            self._weight_array = np.fromiter(self.weights.values(), dtype=np.float64, count=len(self.weights))
+        rows = []
+        ids = []
+        for row, text in enumerate(texts):
+            for key in self.features(self.words(text)):
+                rows.append(row)
+                ids.append(self._ids[key])
+        evidence = np.bincount(
+            np.asarray(rows, dtype=np.intp),
+            weights=self._weight_array[np.asarray(ids, dtype=np.intp)],
+            minlength=len(texts)
+        )
+        personal = 1.0 / (1.0 + np.exp(-np.clip(self.bias + evidence, -500, 500)))
+        return [
+            ("personal", float(p)) if p > 0.5 else ("casual", float(1.0 - p))
+            for p in personal
+        ]
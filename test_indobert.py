@@ -1,63 +1,213 @@
-import torch
-from transformers import BertTokenizer, BertForMaskedLM
-from dictionary_db import DictionaryDB
+from dictionary_db import DictionaryDB, normalize_word
+from phrase_matcher import select_longest
+from style_classifier import TOKEN_PATTERN
+from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Iterable, Iterator, List, Optional, Union
+from caching import LRUCache
+import admission
+import metrics
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
 import re
+import sys
+import threading
+import time
 
-# Initialize BERT model and tokenizer
+# BERT model and tokenizer are loaded on first use; the dictionary-only
+# service never needs them. Set HUMANIZE_PRELOAD_BERT=1 to load at import.
 model_name = "bert-base-multilingual-cased"
-print("Loading tokenizer and model...")
-tokenizer = BertTokenizer.from_pretrained(model_name)
-model = BertForMaskedLM.from_pretrained(model_name)
-model.eval()  # Set model to evaluation mode
-
-def get_bert_embeddings(text: str):
-    """Get BERT embeddings for a given text."""
-    inputs = tokenizer.encode_plus(
-        text,
-        add_special_tokens=True,
-        max_length=512,
-        padding='max_length',
-        truncation=True,
-        return_tensors="pt"
-    )
-    
-    with torch.no_grad():
-        outputs = model(**inputs)
-        embeddings = outputs.last_hidden_state.mean(dim=1)
-    
-    return embeddings
+tokenizer = None
+model = None
+_model_lock = threading.Lock()
+
+def load_model():
+    """Load the BERT tokenizer and model once and return both."""
+    global tokenizer, model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                # Imported here so importing this module stays cheap
+                from transformers import BertTokenizer, BertForMaskedLM
+                print("Loading tokenizer and model...", file=sys.stderr)
+                loaded_tokenizer = BertTokenizer.from_pretrained(model_name)
+                loaded_model = BertForMaskedLM.from_pretrained(model_name)
+                loaded_model.eval()  # Set model to evaluation mode
+                tokenizer = loaded_tokenizer
+                model = loaded_model
+    return tokenizer, model
+
+# Not in worker processes (e.g. parallel.py), which never run BERT
+if os.environ.get("HUMANIZE_PRELOAD_BERT", "").lower() in ("1", "true", "yes") and multiprocessing.parent_process() is None:
+    load_model()
+
+# Sentence embeddings by text hash, so repeated sentences are never re-encoded
+EMBEDDING_BATCH_SIZE = 32
+_embedding_cache = metrics.REGISTRY.register_cache(
+    "embedding", LRUCache(maxsize=int(os.environ.get("HUMANIZE_EMBEDDING_CACHE_SIZE", "4096")))
+)
+
+def _embedding_key(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+def get_bert_embeddings(texts: Union[str, List[str]]):
+    """
+    Get mean-pooled BERT embeddings for one text or a list of texts.
+
+    Uses the hidden states of the base encoder inside the masked LM.
+    Uncached texts are encoded in batches padded only to their longest
+    member, and padding is excluded from the mean. Returns a tensor of
+    shape (len(texts), hidden_size); a single string gives one row.
+    """
+    import torch
+    if isinstance(texts, str):
+        texts = [texts]
+    
+    embeddings = {}
+    missing = []
+    for text in texts:
+        key = _embedding_key(text)
+        if key in embeddings:
+            continue
+        cached = _embedding_cache.get(key)
+        if cached is None:
+            missing.append(text)
+            embeddings[key] = None
+        else:
+            embeddings[key] = cached
+    
+    if missing:
+        tokenizer, model = load_model()
+        for i in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            chunk = missing[i:i + EMBEDDING_BATCH_SIZE]
+            inputs = tokenizer(
+                chunk,
+                add_special_tokens=True,
+                max_length=512,
+                padding=True,
+                truncation=True,
+                return_tensors="pt"
+            )
+            
+            metrics.BERT_BATCH_SIZE.observe(len(chunk), task="embedding")
+            with metrics.BERT_INFERENCE_SECONDS.time(task="embedding"), torch.inference_mode():
+                hidden = model.bert(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1)
+            
+            for text, embedding in zip(chunk, pooled):
+                key = _embedding_key(text)
+                embeddings[key] = embedding
+                _embedding_cache.put(key, embedding)
+    
+    return torch.stack([embeddings[_embedding_key(text)] for text in texts])
+
+class MaskPredictionBatcher:
+    """
+    Batches mask predictions from concurrent callers into one forward pass.
+    """
+    def __init__(self, max_batch_size: int = 16, max_wait: float = 0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, masked_text: str, top_k: int = 10, candidates: Optional[List[List[int]]] = None) -> Future:
+        """
+        Queue a prediction; the Future resolves to one top-k (probabilities,
+        token_ids) pair per mask, or to the candidates' probabilities.
+        """
+        tokenizer, _ = load_model()
+        input_ids = tokenizer.encode(masked_text, add_special_tokens=True, truncation=True, max_length=512)
+        future = Future()
+        self._queue.put((input_ids, top_k, candidates, future))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="bert-batcher", daemon=True)
+                    self._thread.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # Callers that gave up do not take a slot in the forward pass
+            batch = [request for request in batch if request[-1].set_running_or_notify_cancel()]
+            if batch:
+                self._predict(batch)
+
+    def _predict(self, batch: list) -> None:
+        import torch
+        try:
+            tokenizer, model = load_model()
+            longest = max(len(request[0]) for request in batch)
+            input_ids = torch.full((len(batch), longest), tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch), longest), dtype=torch.long)
+            for row, (ids, _, _, _) in enumerate(batch):
+                input_ids[row, :len(ids)] = torch.tensor(ids)
+                attention_mask[row, :len(ids)] = 1
+            
+            metrics.BERT_BATCH_SIZE.observe(len(batch), task="mask")
+            with metrics.BERT_INFERENCE_SECONDS.time(task="mask"), torch.inference_mode():
+                logits = model(input_ids=input_ids, attention_mask=attention_mask).logits
+                for row, (ids, top_k, candidates, future) in enumerate(batch):
+                    positions = (input_ids[row] == tokenizer.mask_token_id).nonzero(as_tuple=True)[0]
+                    probs = torch.nn.functional.softmax(logits[row, positions], dim=-1)
+                    if candidates is not None:
+                        future.set_result([
+                            probs[mask, candidate_ids].tolist()
+                            for mask, candidate_ids in enumerate(candidates[:len(positions)])
+                        ])
+                        continue
+                    top = torch.topk(probs, k=top_k, dim=-1)
+                    future.set_result(list(zip(top.values.tolist(), top.indices.tolist())))
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+_mask_batcher = MaskPredictionBatcher(
+    max_batch_size=int(os.environ.get("HUMANIZE_BERT_MAX_BATCH", "16")),
+    max_wait=float(os.environ.get("HUMANIZE_BERT_MAX_WAIT_MS", "5")) / 1000
+)
 
 def get_bert_suggestions(text: str, mask_token: str, context: str) -> list:
     """Get BERT suggestions for a masked token based on context."""
+    tokenizer, _ = load_model()
+    
     # Replace the target word with mask token
     masked_text = text.replace(mask_token, tokenizer.mask_token)
     
-    # Tokenize the masked text
-    tokens = tokenizer.tokenize(masked_text)
-    # Convert tokens to ids and add special tokens
-    token_ids = tokenizer.convert_tokens_to_ids(tokens)
-    # Prepare input tensor
-    inputs = {
-        "input_ids": torch.tensor([token_ids]),
-        "attention_mask": torch.ones(len(token_ids)).unsqueeze(0)
-    }
-    
-    # Find mask token position
-    mask_positions = [i for i, id in enumerate(token_ids) if id == tokenizer.mask_token_id]
-    if not mask_positions:
+    # Predict in a shared batch with other concurrent callers
+    future = _mask_batcher.submit(masked_text)
+    left = admission.remaining()
+    try:
+        predictions = future.result(timeout=None if left is None else max(left, 0))
+    except FutureTimeoutError:
+        future.cancel()
+        raise admission.DeadlineExceeded("Deadline exceeded waiting for BERT")
+    if not predictions:
         return []
-    mask_idx = mask_positions[0]
-    
-    # Get predictions
-    with torch.no_grad():
-        outputs = model(**inputs)
-        predictions = outputs.logits[0, mask_idx]
-        probs = torch.nn.functional.softmax(predictions, dim=-1)
-        top_k = torch.topk(probs, k=10, dim=-1)
+    scores, pred_ids = predictions[0]
     
     # Get the predicted tokens
     filtered_predictions = []
-    for score, pred_idx in zip(top_k.values, top_k.indices):
+    for score, pred_idx in zip(scores, pred_ids):
         token = tokenizer.decode([pred_idx])
         # Prefer formal words in personal context, casual words in casual context
         if context == "personal":
@@ -68,124 +218,437 @@ def get_bert_suggestions(text: str, mask_token: str, context: str) -> list:
             
     return filtered_predictions[:5]  # Return top 5 filtered predictions
 
-def detect_context(text: str, db: DictionaryDB) -> str:
-    """Detect the context of the text based on keywords."""
-    text = text.lower()
+# Reranking loads BERT, so it runs only where the server enables it;
+# elsewhere rerank requests get the dictionary order
+RERANK_ENABLED = os.environ.get("HUMANIZE_RERANK", "").lower() in ("1", "true", "yes")
+# Time allowed for reranking one text before slots fall back to options[0]
+RERANK_BUDGET = float(os.environ.get("HUMANIZE_RERANK_BUDGET_MS", "50")) / 1000
+SENTENCE_END = {".", "!", "?"}
+_background_loader = None
+_loader_lock = threading.Lock()
+
+def warm_model() -> None:
+    """Load the model and run one prediction, so the first real one is fast."""
+    tokenizer, _ = load_model()
+    _mask_batcher.submit(tokenizer.mask_token, top_k=1).result()
+
+def _warm_in_background() -> None:
+    global _background_loader
+    try:
+        warm_model()
+    except Exception as e:
+        # Let the next rerank request try again
+        print(f"Loading the rerank model failed: {e}", file=sys.stderr)
+        with _loader_lock:
+            _background_loader = None
+
+def _load_model_in_background() -> None:
+    global _background_loader
+    with _loader_lock:
+        if _background_loader is None:
+            _background_loader = threading.Thread(target=_warm_in_background, name="bert-loader", daemon=True)
+            _background_loader.start()
+
+def rerank_options(pieces: List[str], slots: List[tuple], budget: float = RERANK_BUDGET) -> int:
+    """
+    Replace ambiguous pieces with the option BERT finds most fluent.
+
+    slots holds (index, candidates) pairs in dictionary order; slots not
+    scored within budget keep candidates[0]. Returns how many did.
+    """
+    if not RERANK_ENABLED:
+        metrics.RERANK_SLOTS.inc(len(slots), outcome="fallback")
+        return len(slots)
+    if model is None:
+        # Never block a request on loading the model
+        _load_model_in_background()
+        metrics.RERANK_SLOTS.inc(len(slots), outcome="fallback")
+        return len(slots)
+    left = admission.remaining()
+    deadline = time.monotonic() + (budget if left is None else min(budget, left))
+    slot_candidates = dict(slots)
     
-    # Get context detection keywords
-    formal_keywords = db.get_by_category("formal_context")
-    casual_keywords = db.get_by_category("casual_context")
+    # Mask every slot of a sentence and submit all sentences at once
+    submitted = []
+    start = 0
+    for i, piece in enumerate(pieces):
+        if piece not in SENTENCE_END and i + 1 < len(pieces):
+            continue
+        end = i + 1
+        indexes = [j for j in range(start, end) if j in slot_candidates]
+        if indexes:
+            parts = []
+            for j in range(start, end):
+                if j > start and _needs_space(pieces[j-1], pieces[j]):
+                    parts.append(" ")
+                parts.append(tokenizer.mask_token if j in slot_candidates else pieces[j])
+            candidate_ids = [
+                [(tokenizer.encode(candidate, add_special_tokens=False) or [tokenizer.unk_token_id])[0]
+                 for candidate in slot_candidates[j]]
+                for j in indexes
+            ]
+            submitted.append((indexes, _mask_batcher.submit("".join(parts), candidates=candidate_ids)))
+        start = end
     
-    # Count occurrences of each context
-    formal_count = 0
-    casual_count = 0
+    fallbacks = 0
+    for indexes, future in submitted:
+        try:
+            scores = future.result(timeout=max(deadline - time.monotonic(), 0))
+        except Exception:
+            # Out of budget or failed: the dictionary order stands
+            future.cancel()
+            scores = []
+        for i, candidate_scores in zip(indexes, scores):
+            best = max(range(len(candidate_scores)), key=candidate_scores.__getitem__)
+            if best:
+                pieces[i] = slot_candidates[i][best]
+            metrics.RERANK_SLOTS.inc(outcome="changed" if best else "kept")
+        # Masks cut off by truncation are not scored either
+        fallbacks += len(indexes) - len(scores)
+    metrics.RERANK_SLOTS.inc(fallbacks, outcome="fallback")
+    return fallbacks
+
+REWRITE_KINDS = {"phrases", "pattern"}
+CASUAL_MARKER_PATTERN = re.compile(r'\b(?:nih, |tuh )')
+
+# A word or punctuation token with its character offsets in the source text
+Token = namedtuple("Token", ["text", "start", "end"])
+
+class TextAnalysis:
+    """
+    Tokens, style and rewrites of one text, shared by analysis and translation.
+    """
+    def __init__(self, text: str, style: str, tokens: List[Token], rewrites: list,
+                 evidence: float = 0.0):
+        self.text = text
+        self.style = style
+        self.tokens = tokens
+        self.rewrites = rewrites
+        self.evidence = evidence
+        self.entries = None
+        self.changes = []
+        self.reranked = False
+
+    def words(self) -> set:
+        """Distinct words that need a dictionary lookup."""
+        return {token.text for token in self.tokens if token.text.isalnum()}
+
+def tokenize(text: str) -> List[Token]:
+    """Split text into word and punctuation tokens with their offsets."""
+    return [Token(m.group(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+
+def classify_style(text: str, db: DictionaryDB) -> tuple:
+    """Detect the style of the text; returns (style, confidence)."""
+    with metrics.stage("detect_context"):
+        return db.get_classifier().classify(text)
+
+def detect_context(text: str, db: DictionaryDB) -> str:
+    """Detect the style of the text: "casual" or "personal"."""
+    return classify_style(text, db)[0]
+
+def analyze_text(text: str, db: DictionaryDB, style: Optional[str] = None) -> TextAnalysis:
+    """
+    Analyze text once: tokens, style and the phrase/pattern rewrites.
+
+    The style classifier scores the token stream, and a single matcher pass
+    finds phrases and sentence patterns together. Passing a style skips
+    detection and forces it.
+    """
+    admission.check_deadline()
+    with metrics.stage("tokenize"):
+        tokens = tokenize(text)
+    with metrics.stage("detect_context"):
+        classifier = db.get_classifier()
+        evidence = classifier.evidence([token.text.lower() for token in tokens])
+        if not style:
+            style = classifier.style(evidence)
+    with metrics.stage("match"):
+        matches = db.get_matcher().find_all(text, REWRITE_KINDS)
+        # Phrases always apply, sentence patterns only in casual context
+        rewrite_kinds = REWRITE_KINDS if style == "casual" else {"phrases"}
+        rewrites = select_longest([m for m in matches if m.kind in rewrite_kinds])
+    return TextAnalysis(text, style, tokens, rewrites, evidence)
+
+def _rewrite_text(match, text: str, context: str) -> str:
+    """Get the replacement for a phrase or sentence pattern match."""
+    if match.kind == "pattern":
+        translated = match.entry["casual_pattern"]
+    else:
+        options = match.entry.options(context)
+        translated = options[0] if options else text[match.start:match.end]
+    if text[match.start].isupper():
+        translated = translated.capitalize()
+    return translated
+
+def _rewrite_origin(match) -> tuple:
+    """Source span, dictionary entry and category of a rewrite."""
+    if match.kind == "pattern":
+        return (match.start, match.end, match.entry["formal_pattern"], "pattern")
+    return (match.start, match.end, match.entry.word, match.entry.category)
+
+def _strip_casual_markers(pieces: list, origins: list) -> None:
+    """Remove casual filler ("nih, ", "tuh ") that slipped into personal text."""
+    i = 0
+    while i < len(pieces):
+        piece = pieces[i]
+        following = pieces[i+1] if i + 1 < len(pieces) else ""
+        if piece == "nih" and following == ",":
+            del pieces[i:i+2], origins[i:i+2]
+        elif piece == "tuh" and following and _needs_space(piece, following):
+            del pieces[i], origins[i]
+        else:
+            pieces[i] = CASUAL_MARKER_PATTERN.sub("", piece)
+            i += 1
+
+def _needs_space(previous: str, current: str) -> bool:
+    """Words are separated by a space, also after sentence punctuation."""
+    return current[:1].isalnum() and (previous[-1:].isalnum() or previous in ",.!?")
+
+def translate_pieces(text: str, db: DictionaryDB, analysis: TextAnalysis, rerank: bool = False) -> tuple:
+    """
+    Substitute dictionary translations and rewrites for the tokens.
+
+    Returns the output pieces and, for each, the (start, end, entry,
+    category) it came from, or None for an unchanged token. Spacing and
+    the case pass of the style are left to assemble_text.
+    """
+    admission.check_deadline()
+    timer = metrics.StageTimer()
+    if analysis.entries is None:
+        analysis.entries = db.get_entries(analysis.words())
+        timer.lap("lookup")
+    entries = analysis.entries
+    context = analysis.style
+    rewrites = iter(analysis.rewrites)
+    rewrite = next(rewrites, None)
+    rewrite_emitted = False
     
-    for keyword in formal_keywords:
-        if keyword["word"].lower() in text:
-            formal_count += 1
-            
-    for keyword in casual_keywords:
-        if keyword["word"].lower() in text:
-            casual_count += 1
-    
-    # If formal/coaching keywords are found, use personal tone
-    if formal_count > 0:
-        return "personal"
-    # If casual keywords are found or no specific context, use casual tone
-    return "casual"
-
-def translate_text(text: str, db: DictionaryDB) -> str:
-    """Translate text using dictionary and make it more conversational."""
-    context = detect_context(text, db)
-    
-    # First try to match and translate longer phrases
-    translated_text = text
-    phrases = db.get_by_category("phrases")
-    for phrase in phrases:
-        if phrase["word"].lower() in translated_text.lower():
-            options = phrase["translations"]["casual"] if context == "casual" else phrase["translations"]["personal"]
-            translated_text = translated_text.replace(phrase["word"], options[0])
-    
-    # Then handle individual words
-    words = re.findall(r'\b\w+\b|[^\w\s]', translated_text)
+    # Output pieces, each with the (start, end, entry, category) it came from
     translated_words = []
-    word_translations = {}
+    origins = []
+    # Words with several options: (piece index, options)
+    slots = []
     
-    for i, word in enumerate(words):
+    for token in analysis.tokens:
+        word = token.text
+        
+        # Phrases and patterns replace every token they cover
+        while rewrite is not None and rewrite.end <= token.start:
+            rewrite = next(rewrites, None)
+            rewrite_emitted = False
+        if rewrite is not None and rewrite.start <= token.start:
+            if not rewrite_emitted:
+                translated_words.append(_rewrite_text(rewrite, text, context))
+                origins.append(_rewrite_origin(rewrite))
+                rewrite_emitted = True
+            continue
+        
         # Skip punctuation
         if not word.isalnum():
             translated_words.append(word)
+            origins.append(None)
             continue
             
-        # Check if we've already translated this word
-        word_lower = word.lower()
-        if word_lower in word_translations:
-            translated = word_translations[word_lower]
-            if word[0].isupper():
-                translated = translated.capitalize()
-            translated_words.append(translated)
-            continue
-        
-        # Try dictionary translation
-        translation = None
-        for w in [word, word.capitalize(), word.lower()]:
-            translation = db.get_translations(w)
-            if translation:
-                break
-                
-        if translation:
-            # Use dictionary translation based on context
-            options = translation["casual"] if context == "casual" else translation["personal"]
-            translated = options[0] if isinstance(options, list) else options
+        # Dictionary translation based on context, resolved up front
+        entry = entries.get(normalize_word(word))
+        options = entry.options(context) if entry else None
+        if options:
+            translated = options[0]
         else:
             # If no translation, keep original word
             translated = word
         
-        # Store translation for consistency
-        word_translations[word_lower] = translated
-        
         # Preserve original capitalization
         if word[0].isupper():
             translated = translated.capitalize()
+        if rerank and options and len(options) > 1:
+            if word[0].isupper():
+                options = [option.capitalize() for option in options]
+            slots.append((len(translated_words), options))
         translated_words.append(translated)
+        origins.append((token.start, token.end, entry.word, entry.category) if entry else None)
     
-    # Join words with proper spacing
-    result = ""
-    for i, word in enumerate(translated_words):
-        if i > 0:
-            if word.isalnum() and (translated_words[i-1].isalnum() or translated_words[i-1] in ",.!?"):
-                result += " "
-        result += word
-    
-    # Add context-specific markers based on content
-    if context == "casual":
-        # Get all patterns from database
-        all_patterns = db.get_pattern()
-        
-        # Try to match patterns
-        matched_pattern = None
-        for pattern in all_patterns:
-            if pattern["formal_pattern"].lower() in text.lower():
-                matched_pattern = pattern
-                break
-        
-        if matched_pattern:
-            # Replace the formal pattern with casual pattern
-            result = result.replace(
-                matched_pattern["formal_pattern"].lower(),
-                matched_pattern["casual_pattern"].lower()
-            )
-        
-        # Make everything lowercase for casual context
-        result = result.lower()
-    else:
-        # Remove any casual markers that might have slipped through
-        result = result.replace("nih, ", "").replace("tuh ", "")
-        if result[0].islower():
-            result = result.capitalize()
+    timer.lap("substitute")
+    analysis.reranked = rerank
+    if slots:
+        analysis.reranked = rerank_options(translated_words, slots) == 0
+        timer.lap("rerank")
+    
+    return translated_words, origins
+
+def assemble_text(text: str, pieces: list, origins: list, context: str,
+                  track_changes: bool = True) -> tuple:
+    """
+    Join translated pieces into the output text; returns (text, changes).
+
+    Casual filler is stripped from personal text, words are spaced and
+    the case pass of the style runs over the whole output, so pieces of a
+    document translated sentence by sentence come out exactly as if it was
+    translated in one go.
+    """
+    if context != "casual":
+        _strip_casual_markers(pieces, origins)
+    
+    # Join words with proper spacing, noting which part each substitution is
+    parts = []
+    substitutions = []
+    for i, word in enumerate(pieces):
+        if i > 0 and _needs_space(pieces[i-1], word):
+            parts.append(" ")
+        if track_changes and origins[i] is not None:
+            substitutions.append((len(parts), origins[i]))
+        parts.append(word)
+    
+    # Fold the case part by part rather than the joined text, so offsets
+    # stay exact where folding changes a length ("İ" lowercases to two
+    # characters)
+    first = next((i for i, part in enumerate(parts) if part), None)
+    if first is not None:
+        if context == "casual":
+            # Make everything lowercase for casual context
+            parts = [part.lower() for part in parts]
+        elif parts[first][0].islower():
+            parts = [part.lower() for part in parts]
+            parts[first] = parts[first].capitalize()
+    
+    offsets = [0]
+    for part in parts:
+        offsets.append(offsets[-1] + len(part))
+    changes = []
+    for index, (start, end, entry, category) in substitutions:
+        changes.append({
+            "original": text[start:end],
+            "humanized": parts[index],
+            "source_span": (start, end),
+            "target_span": (offsets[index], offsets[index + 1]),
+            "entry": entry,
+            "category": category
+        })
+    return "".join(parts), changes
+
+def translate_text(text: str, db: DictionaryDB, analysis: Optional[TextAnalysis] = None,
+                   track_changes: bool = True, rerank: bool = False) -> str:
+    """
+    Translate text using dictionary and make it more conversational.
+
+    Each substitution is recorded in analysis.changes as it is made, with
+    its source and target spans, dictionary entry and category. Pass
+    track_changes=False to skip the bookkeeping. With rerank=True, words
+    with several translations get the one BERT prefers in context
+    (see rerank_options) instead of the first.
+    """
+    if analysis is None:
+        analysis = analyze_text(text, db)
+    pieces, origins = translate_pieces(text, db, analysis, rerank=rerank)
+    timer = metrics.StageTimer()
+    result, analysis.changes = assemble_text(text, pieces, origins, analysis.style, track_changes)
+    timer.lap("assemble")
+    metrics.record_tokens(len(analysis.tokens), analysis.style)
     
     return result
 
+# Sentences end at ., ! or ? followed by whitespace; blank lines end paragraphs
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n\s*\n')
+MAX_CHUNK_CHARS = 10000
+
+class SentenceSplitter:
+    """
+    Incrementally split streamed text into sentences and paragraphs.
+
+    feed() accepts text in arbitrary pieces and returns the chunks that are
+    complete so far as (offset, text, separator) tuples, where separator is
+    the whitespace that followed the chunk. Whitespace with no text before
+    it comes as a chunk with empty text, so joining text and separator of
+    every chunk rebuilds the input, and the chunks do not depend on how it
+    was read. Only the unfinished tail is buffered, and a run without any
+    boundary is cut at max_chars, so memory stays bounded however large
+    the input is.
+    """
+    def __init__(self, max_chars: int = MAX_CHUNK_CHARS):
+        self.max_chars = max_chars
+        self._buffer = ""
+        self._offset = 0
+
+    def _emit(self, chunks: list, end: int, separator_end: int) -> None:
+        chunk = self._buffer[:end]
+        if chunk.strip():
+            chunks.append((self._offset, chunk, self._buffer[end:separator_end]))
+        else:
+            chunks.append((self._offset, "", self._buffer[:separator_end]))
+        self._buffer = self._buffer[separator_end:]
+        self._offset += separator_end
+
+    def _split(self, chunks: list, final: bool) -> None:
+        while self._buffer:
+            match = SENTENCE_BOUNDARY.search(self._buffer)
+            # Whitespace at the end of the buffer may still continue
+            tail = len(self._buffer.rstrip())
+            if match is not None and match.start() <= self.max_chars:
+                if match.start() < tail:
+                    self._emit(chunks, match.start(), match.end())
+                    continue
+                if final:
+                    self._emit(chunks, match.start(), len(self._buffer))
+                break
+            if len(self._buffer) > self.max_chars:
+                # Wait while a boundary may still start within max_chars
+                if not final and "\n" in self._buffer[tail:self.max_chars + 1]:
+                    break
+                cut = self._buffer.rfind(" ", 0, self.max_chars)
+                if cut <= 0:
+                    cut = self.max_chars
+                self._emit(chunks, cut, cut + (self._buffer[cut] == " "))
+                continue
+            if final:
+                self._emit(chunks, tail, len(self._buffer))
+            break
+
+    def feed(self, text: str) -> list:
+        self._buffer += text
+        chunks = []
+        self._split(chunks, final=False)
+        return chunks
+
+    def flush(self) -> list:
+        chunks = []
+        self._split(chunks, final=True)
+        return chunks
+
+def split_sentences(pieces: Iterable[str], max_chars: int = MAX_CHUNK_CHARS) -> Iterator[tuple]:
+    """Yield (offset, text, separator) chunks from an iterable of text pieces."""
+    splitter = SentenceSplitter(max_chars)
+    for piece in pieces:
+        yield from splitter.feed(piece)
+    yield from splitter.flush()
+
+def humanize_chunk(offset: int, chunk: str, separator: str, db: DictionaryDB,
+                   style: Optional[str] = None, track_changes: bool = False) -> dict:
+    """Humanize one streamed chunk into an NDJSON-ready record."""
+    analysis = analyze_text(chunk, db, style=style)
+    humanized = translate_text(chunk, db, analysis, track_changes=track_changes)
+    record = {
+        "offset": offset,
+        "original_text": chunk,
+        "humanized_text": humanized,
+        "separator": separator,
+        "detected_style": analysis.style
+    }
+    if track_changes:
+        record["word_changes"] = analysis.changes
+    return record
+
+def humanize_stream(pieces: Iterable[str], db: DictionaryDB, style: Optional[str] = None,
+                    track_changes: bool = False) -> Iterator[dict]:
+    """
+    Humanize a stream of text chunk by chunk.
+
+    Records are yielded as soon as each sentence or paragraph is complete;
+    joining humanized_text and separator of every record rebuilds the
+    document.
+    """
+    for offset, chunk, separator in split_sentences(pieces):
+        yield humanize_chunk(offset, chunk, separator, db, style, track_changes)
+
 def main():
     print("🤖 Casual Indonesian Translator")
     print("Connecting to database...")
@@ -204,12 +667,43 @@ def main():
             print("\n👋 Goodbye!")
             break
         
-        context = detect_context(text, db)
-        print(f"\nDetected context: {context}")
+        analysis = analyze_text(text, db)
+        print(f"\nDetected context: {analysis.style}")
         
-        translated = translate_text(text, db)
+        translated = translate_text(text, db, analysis)
         print("\n🎯 Translation:")
         print(f"→ {translated}")
 
+def stream_main(args) -> None:
+    """Humanize a file (or stdin) and write one NDJSON record per chunk."""
+    db = DictionaryDB()
+    # stdout carries the NDJSON records, so status messages go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        connected = db.connect()
+    if not connected:
+        print("Failed to connect to database. Exiting...", file=sys.stderr)
+        sys.exit(1)
+    
+    source = open(args.stream, encoding="utf-8") if args.stream != "-" else sys.stdin
+    try:
+        pieces = iter(lambda: source.read(65536), "")
+        for record in humanize_stream(pieces, db, style=args.style, track_changes=args.changes):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Casual Indonesian Translator")
+    parser.add_argument("--stream", metavar="FILE",
+                        help="humanize FILE ('-' for stdin) and write NDJSON records to stdout")
+    parser.add_argument("--style", choices=["casual", "personal"],
+                        help="force a style instead of detecting it per chunk")
+    parser.add_argument("--changes", action="store_true",
+                        help="include word_changes in every streamed record")
+    args = parser.parse_args()
+    if args.stream:
+        stream_main(args)
+    else:
+        main() 
\ No newline at end of file
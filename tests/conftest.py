@@ -0,0 +1,20 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dictionary_db import InMemoryDictionaryDB
+
+
+@pytest.fixture(scope="session")
+def db():
+    """The seed dictionary, in memory."""
+    db = InMemoryDictionaryDB()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.connect()
+    return db
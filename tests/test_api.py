@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import humanizeindo
+from admission import DeadlineExceeded
+from sessions import EditSession
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Not entered as a context manager: validation needs no dictionary
+    return TestClient(humanizeindo.app)
+
+
+@pytest.mark.parametrize("style", ["bogus", "Casual"])
+def test_unknown_style_is_rejected(client, style):
+    assert client.post("/humanize", json={"text": "Saya dapat.", "style": style}).status_code == 422
+    assert client.post("/humanize/batch", json={"items": [{"text": "Saya dapat.", "style": style}]}).status_code == 422
+    assert client.post("/sessions", json={"text": "Saya dapat.", "style": style}).status_code == 422
+    assert client.post("/humanize/stream", params={"style": style}, content=b"Saya dapat.").status_code == 422
+
+
+def test_stream_failure_ends_with_error_record(client, db, monkeypatch):
+    def failing_stream(pieces, db, style=None, track_changes=False):
+        yield {"offset": 0, "humanized_text": "gue bisa.", "separator": " "}
+        raise FileNotFoundError("dictionary artifact missing")
+
+    monkeypatch.setattr(humanizeindo.app.state, "db", db, raising=False)
+    monkeypatch.setattr(humanizeindo, "humanize_stream", failing_stream)
+    response = client.post("/humanize/stream", content="Saya dapat. Kamu dapat.".encode("utf-8"))
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert lines[0]["humanized_text"] == "gue bisa."
+    assert lines[-1] == {"error": "dictionary artifact missing"}
+
+
+def test_session_state_maps_deadline_to_504(client, db, monkeypatch):
+    session = EditSession(db, "Saya dapat membantu.")
+    humanizeindo.sessions.put(session.id, session)
+
+    def expired(session):
+        raise DeadlineExceeded("Deadline exceeded by 5ms")
+
+    monkeypatch.setattr(humanizeindo.app.state, "db", db, raising=False)
+    monkeypatch.setattr(humanizeindo, "session_response", expired)
+    response = client.get(f"/sessions/{session.id}")
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Deadline exceeded by 5ms"}
+    assert client.get("/sessions/missing").status_code == 404
+
+
+def test_session_documents_are_limited(client, db, monkeypatch):
+    monkeypatch.setattr(humanizeindo.app.state, "db", db, raising=False)
+    monkeypatch.setattr(humanizeindo, "SESSION_MAX_CHARS", 20)
+    assert client.post("/sessions", json={"text": "Saya dapat membantu anda sekarang."}).status_code == 422
+
+    session_id = client.post("/sessions", json={"text": "Saya dapat."}).json()["session_id"]
+    response = client.post(f"/sessions/{session_id}/edits",
+                           json={"edits": [{"start": 11, "end": 11, "text": " Saya dapat membantu."}]})
+    assert response.status_code == 422
+    assert client.get(f"/sessions/{session_id}").json()["revision"] == 0
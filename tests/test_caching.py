@@ -0,0 +1,28 @@
+import humanizeindo
+from caching import LRUCache
+from humanizeindo import HumanizeRequest, humanize_request
+
+
+def test_weight_budget_evicts_and_skips_oversized_values():
+    cache = LRUCache(maxsize=10, maxweight=10, weigh=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "xxxx")
+    cache.put("c", "xxxx")
+
+    assert cache.get("a") is None
+    assert cache.weight == 8
+    cache.put("d", "x" * 11)
+    assert cache.get("d") is None
+    assert cache.stats()["evictions"] == 1
+    cache.pop("b")
+    assert cache.weight == 4
+
+
+def test_reformatted_text_shares_a_cache_entry(db, monkeypatch):
+    monkeypatch.setattr(humanizeindo, "result_cache", LRUCache(maxsize=10))
+    first = humanize_request(HumanizeRequest(text="Saya dapat  membantu\nkamu.", style="casual", track_changes=False), db)
+    second = humanize_request(HumanizeRequest(text="saya DAPAT membantu kamu.", style="casual", track_changes=False), db)
+
+    assert humanizeindo.result_cache.hits == 1
+    assert second.humanized_text == first.humanized_text
+    assert second.original_text == "saya DAPAT membantu kamu."
@@ -0,0 +1,56 @@
+import contextlib
+import io
+import time
+
+from pymongo.errors import ServerSelectionTimeoutError
+
+import dictionary_db
+from dictionary_artifact import ArtifactDictionaryDB, write_artifact
+from dictionary_db import DictionaryDB, seed_patterns, seed_words
+
+GREETING = {"word": "halo", "translations": {"casual": ["hai"], "personal": ["hai"]}, "category": "greetings"}
+
+
+def test_snapshot_refreshes_in_the_background(tmp_path):
+    path = str(tmp_path / "dictionary.idx")
+    write_artifact(path, list(seed_words()), list(seed_patterns()), 1)
+    db = ArtifactDictionaryDB(path, refresh_interval=3600)
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert db.connect()
+    old = db.get_snapshot()
+
+    write_artifact(path, list(seed_words()) + [GREETING], list(seed_patterns()), 2)
+    db.refresh_interval = 0
+    # Readers keep the current snapshot while the new one loads
+    assert db.get_snapshot() is old
+
+    deadline = time.monotonic() + 10
+    while db.get_snapshot() is old:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert db.get_translations("halo") == {"casual": ["hai"], "personal": ["hai"]}
+
+
+def test_connect_retries_close_their_clients(monkeypatch):
+    clients = []
+
+    class UnreachableClient:
+        def __init__(self, *args, **kwargs):
+            self.closed = False
+            self.admin = self
+            clients.append(self)
+
+        def command(self, name):
+            raise ServerSelectionTimeoutError("no servers")
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(dictionary_db, "MongoClient", UnreachableClient)
+    db = DictionaryDB()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert not db.connect()
+        assert not db.connect()
+
+    assert len(clients) == 2
+    assert all(client.closed for client in clients)
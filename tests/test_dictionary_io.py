@@ -0,0 +1,33 @@
+import contextlib
+import io
+
+import dictionary_io
+from dictionary_db import InMemoryDictionaryDB
+
+ROWS = [
+    '[]',
+    '"halo"',
+    '{"word": 5, "category": "greetings"}',
+    '{"word": "halo", "category": "greetings", "casual": "hai"}',
+    '{"word": "halo", "category": "greetings", "translations": ["hai"]}',
+    '{"word": "halo", "category": "greetings", "casual": ["hai"], "personal": ["hai"]}',
+]
+
+
+def test_import_reports_rows_of_the_wrong_type(tmp_path):
+    path = tmp_path / "words.jsonl"
+    path.write_text("\n".join(ROWS) + "\n", encoding="utf-8")
+    db = InMemoryDictionaryDB()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        db.connect()
+        stats, errors = dictionary_io.import_file(db, str(path))
+
+    assert stats["processed"] == 1
+    assert errors == [
+        "row 1: expected an object, got list",
+        "row 2: expected an object, got str",
+        "row 3: invalid word",
+        "row 4: invalid casual",
+        "row 5: invalid translations",
+    ]
+    assert db.get_translations("halo") == {"casual": ["hai"], "personal": ["hai"]}
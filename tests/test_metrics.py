@@ -0,0 +1,11 @@
+import metrics
+
+
+def test_token_style_label_is_bounded():
+    metrics.record_tokens(3, "casual")
+    metrics.record_tokens(2, "bogus")
+
+    rendered = metrics.REGISTRY.render()
+    assert 'humanize_tokens_processed_total{style="casual"}' in rendered
+    assert 'humanize_tokens_processed_total{style="other"}' in rendered
+    assert "bogus" not in rendered
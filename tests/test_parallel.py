@@ -0,0 +1,71 @@
+import contextlib
+import io
+import time
+
+import pytest
+
+from dictionary_db import InMemoryDictionaryDB
+from parallel import ParallelHumanizer, _ready
+from test_indobert import analyze_text, translate_text
+
+PARAGRAPHS = [
+    "Saya dapat membantu kamu di Jakarta.",
+    "Budi ingin mempelajari keterampilan baru untuk karier. Kamu bisa ikut?",
+    "jika Anda mau, pertimbangkan tujuan hidup dan pekerjaan di Bandung tuh",
+    "Ini berarti langkah ini berguna. Apakah Anda setuju nih, Siti?",
+]
+DOCUMENT = "\n\n".join(PARAGRAPHS * 3)
+
+
+@pytest.fixture(scope="module")
+def humanizer(db):
+    humanizer = ParallelHumanizer(db, workers=2, min_chars=0, batch_chars=1)
+    humanizer.start()
+    yield humanizer
+    humanizer.close()
+
+
+@pytest.mark.parametrize("style", ["casual", "personal", None])
+def test_parallel_matches_in_process(db, humanizer, style):
+    analysis = analyze_text(DOCUMENT, db, style=style)
+    expected = translate_text(DOCUMENT, db, analysis)
+
+    humanized, detected, changes, _ = humanizer.humanize(DOCUMENT, style=style, track_changes=True)
+
+    assert detected == analysis.style
+    assert humanized == expected
+    assert changes == analysis.changes
+
+
+def test_pool_restarts_in_the_background():
+    db = InMemoryDictionaryDB()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.connect()
+    humanizer = ParallelHumanizer(db, workers=2, min_chars=0)
+    try:
+        humanizer.start()
+        old_version = db.version
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.add_word("halo", ["hai"], ["hai"], "greetings")
+
+        # Served by the current workers while new ones start
+        held, _ = humanizer._acquire()
+        humanized, _, _, version = humanizer.humanize(DOCUMENT, style="casual")
+        assert version == old_version
+        assert humanized == translate_text(DOCUMENT, db, analyze_text(DOCUMENT, db, style="casual"))
+
+        deadline = time.monotonic() + 60
+        while humanizer._version != db.version:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        # The old pool is only shut down once its last map is done
+        assert list(held.map(_ready, range(2)))
+        humanizer._release(held)
+        with pytest.raises(RuntimeError):
+            held.submit(_ready)
+
+        humanized, _, _, version = humanizer.humanize("Halo. " + DOCUMENT, style="casual")
+        assert version == db.version
+        assert humanized.startswith("hai.")
+    finally:
+        humanizer.close()
@@ -0,0 +1,64 @@
+import pytest
+
+import test_indobert
+from test_indobert import analyze_text, translate_text
+
+
+@pytest.mark.parametrize("style, expected", [
+    ("casual", ["bisa", "buat", "gue"]),
+    ("personal", ["dapat", "untuk", "aku"]),
+])
+def test_change_spans_survive_case_folding(db, style, expected):
+    # "İ" lowercases to two characters, which used to shift every later span
+    text = "İstanbul dapat untuk saya."
+    analysis = analyze_text(text, db, style=style)
+    humanized = translate_text(text, db, analysis)
+
+    assert [change["humanized"] for change in analysis.changes] == expected
+    for change in analysis.changes:
+        start, end = change["target_span"]
+        assert humanized[start:end] == change["humanized"]
+        assert text[slice(*change["source_span"])] == change["original"]
+
+
+def test_rerank_disabled_never_loads_the_model(monkeypatch):
+    monkeypatch.setattr(test_indobert, "RERANK_ENABLED", False)
+    monkeypatch.setattr(test_indobert, "load_model", lambda: pytest.fail("model loaded"))
+    pieces = ["saya", "bisa", "."]
+
+    assert test_indobert.rerank_options(pieces, [(1, ["bisa", "dapat"])]) == 1
+    assert pieces == ["saya", "bisa", "."]
+
+
+def test_failed_model_load_is_retried(monkeypatch):
+    def fail():
+        raise OSError("no network")
+    monkeypatch.setattr(test_indobert, "RERANK_ENABLED", True)
+    monkeypatch.setattr(test_indobert, "load_model", fail)
+    monkeypatch.setattr(test_indobert, "model", None)
+
+    for _ in range(2):
+        assert test_indobert.rerank_options(["saya", "."], [(0, ["saya", "aku"])]) == 1
+        loader = test_indobert._background_loader
+        assert loader is not None
+        loader.join(timeout=5)
+        assert test_indobert._background_loader is None
+
+
+DOCUMENT = "  \n\nSaya dapat. Anda   bisa!\n \n\n  Jika anda ingin? \n\n" + "kata " * 30 + "\n\n  "
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(DOCUMENT)])
+def test_split_sentences_does_not_depend_on_reads(size):
+    pieces = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+    chunks = list(test_indobert.split_sentences(pieces, max_chars=40))
+
+    assert chunks == list(test_indobert.split_sentences([DOCUMENT], max_chars=40))
+    assert "".join(text + separator for _, text, separator in chunks) == DOCUMENT
+    assert all(len(text) <= 40 for _, text, _ in chunks)
+
+
+def test_stream_rebuilds_leading_whitespace(db):
+    records = list(test_indobert.humanize_stream(["  \n\n", "Saya dapat."], db, style="casual"))
+
+    assert "".join(r["humanized_text"] + r["separator"] for r in records) == "  \n\ngue bisa."
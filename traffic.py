@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import contextlib
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Endpoints whose requests are recorded
+RECORDED_PATHS = ("/humanize", "/detect-style")
+
+# Latency histogram buckets of the replay report, in milliseconds
+REPORT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class TrafficRecorder:
+    """
+    ASGI middleware appending recorded requests to a JSONL file.
+
+    Each line holds the arrival time, method, path, query string and raw
+    body of a request, plus the status and latency the service answered
+    with. The body is teed from the ASGI receive channel, so the app reads
+    it as usual. sample is the fraction of requests recorded. Recordings
+    hold real user text; keep them out of the repository.
+    """
+    def __init__(self, app, path, sample=1.0, paths=RECORDED_PATHS):
+        self.app = app
+        self.path = path
+        self.sample = sample
+        self.paths = set(paths)
+        self._lock = threading.Lock()
+        self._handle = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths or random.random() >= self.sample:
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.time()
+        started = time.perf_counter()
+        body = bytearray()
+        status = None
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            self.write({
+                "time": arrived,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "body": body.decode("utf-8", errors="replace"),
+                "status": status,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 3)
+            })
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(self.path, "a", encoding="utf-8")
+            self._handle.write(line)
+            self._handle.flush()
+
+
+def read_recording(path):
+    """Load recorded requests, skipping malformed lines."""
+    records = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "method" in record and "path" in record:
+                records.append(record)
+    return records
+
+
+def generate_recording(path, count, seed=0, dictionary_size=1000):
+    """
+    Write a synthetic recording (mostly /humanize, some /detect-style) for
+    sizing before real traffic has been recorded.
+    """
+    from benchmark import synthetic_lexicon, synthetic_text
+    rng = random.Random(seed)
+    entries = synthetic_lexicon(dictionary_size, seed)
+    now = time.time()
+    with open(path, "w", encoding="utf-8") as handle:
+        for index in range(count):
+            text = synthetic_text(entries, rng.choice([0, 0, 0, 300, 1000, 4000]), seed + index)
+            if rng.random() < 0.2:
+                record = {"method": "GET", "path": "/detect-style", "query": urllib.parse.urlencode({"text": text}), "body": ""}
+            else:
+                record = {"method": "POST", "path": "/humanize", "query": "", "body": json.dumps({"text": text}, ensure_ascii=False)}
+            record["time"] = now + index * 0.1
+            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return count
+
+
+class HTTPTarget:
+    """Replays requests against a running server, one keep-alive connection per thread."""
+    def __init__(self, url, concurrency, timeout=30.0):
+        parsed = urllib.parse.urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.netloc = parsed.netloc
+        self.prefix = parsed.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay")
+
+    def _send(self, record):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        path = self.prefix + record["path"] + ("?" + record["query"] if record.get("query") else "")
+        body = record.get("body", "").encode("utf-8") or None
+        headers = {"Content-Type": "application/json"} if body else {}
+        try:
+            connection.request(record["method"], path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection; the next request reconnects
+            connection.close()
+            self._local.connection = None
+            raise
+
+    async def send(self, record):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._send, record)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class ASGITarget:
+    """Replays requests against the app in this process, without a server."""
+    def __init__(self, app):
+        self.app = app
+
+    async def send(self, record):
+        from benchmark import asgi_request
+        body = record.get("body", "").encode("utf-8")
+        headers = [(b"content-type", b"application/json")] if body else []
+        status, _, _ = await asgi_request(
+            self.app, record["method"], record["path"], body, headers, record.get("query", "").encode("latin-1")
+        )
+        return status
+
+    def close(self):
+        pass
+
+
+def arrival_offsets(records, rate=None, poisson=False, speed=1.0, seed=0):
+    """
+    Yield scheduled send times, in seconds from the start, for open-loop replay.
+
+    A fixed rate spaces requests evenly (or exponentially with poisson);
+    without a rate the recorded inter-arrival times are kept, scaled by
+    speed, and the recording repeats after its last request.
+    """
+    if rate:
+        rng = random.Random(seed)
+        offset = 0.0
+        while True:
+            yield offset
+            offset += rng.expovariate(rate) if poisson else 1.0 / rate
+    times = [record.get("time", 0.0) for record in records]
+    span = times[-1] - times[0]
+    period = span + (span / (len(times) - 1) if len(times) > 1 else 1.0)
+    repetition = 0
+    while True:
+        for recorded in times:
+            yield (recorded - times[0] + period * repetition) / speed
+        repetition += 1
+
+
+async def replay(target, records, count, concurrency=1, open_loop=False, offsets=None, duration=None):
+    """
+    Send count requests cycling through records.
+
+    Closed loop: concurrency workers each send their next request as soon
+    as the previous one answers. Open loop: requests go out at their
+    scheduled offsets however slow the service is, and latency is measured
+    from the scheduled time so queueing delay is not hidden.
+    Returns a list of (path, status or None, latency seconds, error).
+    """
+    results = []
+    started = time.perf_counter()
+
+    async def send(index, scheduled):
+        record = records[index % len(records)]
+        try:
+            status = await target.send(record)
+            error = None if 200 <= status < 400 else f"HTTP {status}"
+        except Exception as e:
+            status, error = None, f"{type(e).__name__}: {e}"
+        results.append((record["path"], status, time.perf_counter() - scheduled, error))
+
+    def expired():
+        return duration is not None and time.perf_counter() - started >= duration
+
+    if open_loop:
+        tasks = []
+        for index, offset in zip(range(count), offsets):
+            scheduled = started + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if expired():
+                break
+            tasks.append(asyncio.ensure_future(send(index, scheduled)))
+        if tasks:
+            await asyncio.gather(*tasks)
+    else:
+        indexes = iter(range(count))
+
+        async def worker():
+            for index in indexes:
+                if expired():
+                    return
+                await send(index, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    """Latency percentiles and histogram, error rate and throughput of a replay."""
+    from benchmark import percentile
+    latencies = sorted(latency * 1000 for _, _, latency, _ in results)
+    errors = [error for _, _, _, error in results if error]
+    statuses = {}
+    for _, status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    histogram = {}
+    for bound in REPORT_BUCKETS_MS + (float("inf"),):
+        histogram["+Inf" if bound == float("inf") else str(bound)] = sum(1 for latency in latencies if latency <= bound)
+    by_path = {}
+    for path in sorted({path for path, _, _, _ in results}):
+        path_latencies = sorted(latency * 1000 for p, _, latency, _ in results if p == path)
+        by_path[path] = {
+            "requests": len(path_latencies),
+            "p50_ms": round(percentile(path_latencies, 0.50), 3),
+            "p99_ms": round(percentile(path_latencies, 0.99), 3)
+        }
+    first_errors = {}
+    for error in errors:
+        first_errors[error] = first_errors.get(error, 0) + 1
+    return {
+        "requests": len(results),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "statuses": statuses,
+        "errors": dict(sorted(first_errors.items(), key=lambda item: -item[1])[:10]),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p90": round(percentile(latencies, 0.90), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "p999": round(percentile(latencies, 0.999), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0
+        },
+        "histogram_ms": histogram,
+        "by_path": by_path
+    }
+
+
+def print_report(report):
+    latency = report["latency_ms"]
+    print(
+        f"{report['requests']} requests in {report['seconds']}s: {report['throughput_rps']} req/s, "
+        f"{report['error_rate']:.2%} errors {report['statuses']}",
+        file=sys.stderr
+    )
+    print(
+        f"latency ms: mean {latency['mean']}  p50 {latency['p50']}  p90 {latency['p90']}  "
+        f"p99 {latency['p99']}  p99.9 {latency['p999']}  max {latency['max']}",
+        file=sys.stderr
+    )
+    previous = 0
+    total = max(report["requests"], 1)
+    for bound, cumulative in report["histogram_ms"].items():
+        count = cumulative - previous
+        previous = cumulative
+        print(f"  <= {bound:>6} ms {count:8d} {'#' * round(40 * count / total)}", file=sys.stderr)
+    for path, stats in report["by_path"].items():
+        print(f"  {path}: {stats['requests']} requests, p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms", file=sys.stderr)
+    for error, count in report["errors"].items():
+        print(f"  {count} x {error}", file=sys.stderr)
+
+
+def in_process_app(artifact=None, mongo=False):
+    """The FastAPI app with a dictionary attached, for in-process replay."""
+    import humanizeindo
+    from dictionary_artifact import open_dictionary
+    from dictionary_db import InMemoryDictionaryDB
+    db = open_dictionary(artifact) if artifact or mongo else InMemoryDictionaryDB()
+    with contextlib.redirect_stdout(sys.stderr):
+        if not db.connect():
+            raise SystemExit("Could not load the dictionary")
+    humanizeindo.app.state.db = db
+    return humanizeindo.app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Record HumanizeIndo API traffic and replay it as a load test. Recording is enabled in "
+                    "the service with HUMANIZE_RECORD_TRAFFIC=FILE; replay sends the recorded requests to a "
+                    "server (--url) or to the app in this process and reports latency, errors and throughput.",
+        epilog="examples: traffic.py replay traffic.jsonl --url http://localhost:8000 --concurrency 8 | "
+               "traffic.py replay traffic.jsonl --rate 50 --duration 60 | "
+               "traffic.py generate traffic.jsonl --count 1000"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic recording")
+    generate.add_argument("path")
+    generate.add_argument("--count", type=int, default=1000)
+    generate.add_argument("--seed", type=int, default=0)
+
+    run = commands.add_parser("replay", help="replay a recording")
+    run.add_argument("path", help="JSONL recording")
+    run.add_argument("--url", help="base URL of a running server; default is the app in this process")
+    run.add_argument("--artifact", help="in-process: serve this dictionary artifact instead of the seed data")
+    run.add_argument("--mongo", action="store_true", help="in-process: serve the MongoDB dictionary")
+    run.add_argument("--concurrency", type=int, default=4, help="closed-loop workers, or HTTP connections")
+    run.add_argument("--rate", type=float, help="open loop: requests per second")
+    run.add_argument("--poisson", action="store_true", help="open loop: exponential inter-arrival times")
+    run.add_argument("--recorded-timing", action="store_true", help="open loop: keep the recorded arrival times")
+    run.add_argument("--speed", type=float, default=1.0, help="speed-up factor for --recorded-timing")
+    run.add_argument("--requests", type=int, help="requests to send; default is the whole recording once")
+    run.add_argument("--duration", type=float, help="stop sending after this many seconds")
+    run.add_argument("--output", metavar="FILE", help="write the report as JSON ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        print(f"Wrote {generate_recording(args.path, args.count, args.seed)} requests to {args.path}", file=sys.stderr)
+        return 0
+
+    records = read_recording(args.path)
+    if not records:
+        print(f"No requests in {args.path}", file=sys.stderr)
+        return 1
+    records.sort(key=lambda record: record.get("time", 0.0))
+    # With only a duration, keep cycling through the recording until it ends
+    count = args.requests or (len(records) if args.duration is None else sys.maxsize)
+    open_loop = bool(args.rate or args.recorded_timing)
+    offsets = arrival_offsets(records, args.rate, args.poisson, args.speed) if open_loop else None
+
+    target = HTTPTarget(args.url, args.concurrency) if args.url else ASGITarget(in_process_app(args.artifact, args.mongo))
+    try:
+        results, elapsed = asyncio.run(replay(target, records, count, args.concurrency, open_loop, offsets, args.duration))
+    finally:
+        target.close()
+
+    report = summarize(results, elapsed)
+    report["config"] = {
+        "target": args.url or "in-process",
+        "mode": "open" if open_loop else "closed",
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "recorded_timing": args.recorded_timing
+    }
+    print_report(report)
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())